@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Cache key canonicalization benchmark
+
+Replays a corpus of expressions (the calculator's history file by
+default) and compares the cache hit rate when results are keyed by
+normalized text with the hit rate when they are keyed by canonical
+form. Without a history file, a generated corpus of respelled
+expressions is used instead.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from calc_loader import load_calculator
+
+HISTORY_FILE = os.path.expanduser("~/.calc_history/history.txt")
+
+
+def read_history(path):
+    """Return the expressions recorded in a history file"""
+    expressions = []
+    with open(path) as f:
+        for line in f:
+            _, _, entry = line.partition(" | ")
+            expression, separator, _ = entry.rpartition(" = ")
+            if separator and not expression.startswith("convert"):
+                expressions.append(expression)
+    return expressions
+
+
+def generate_corpus(count, seed=0):
+    """Return count expressions drawn from a few shapes, spelled differently"""
+    rng = random.Random(seed)
+    functions = ["sin", "cos", "sqrt", "log"]
+    expressions = []
+
+    for _ in range(count):
+        a, b = rng.randint(1, 20), rng.randint(1, 20)
+        function = rng.choice(functions)
+        terms = [f"{a}*{b}", f"{function}({a})", str(b)]
+        if rng.random() < 0.5:
+            terms = [f"{b}*{a}", terms[1], terms[2]]
+        rng.shuffle(terms)
+        space = rng.choice(["", " "])
+        expression = f"{space}+{space}".join(terms)
+        if rng.random() < 0.3:
+            expression = f"({expression})"
+        if rng.random() < 0.3:
+            expression = expression.upper()
+        expressions.append(expression)
+
+    return expressions
+
+
+def replay(calc, expressions, key):
+    """Return the hit rate and seconds taken when caching results by key"""
+    cache = {}
+    hits = 0
+    start = time.perf_counter()
+
+    for expression in expressions:
+        try:
+            k = key(expression)
+        except (ValueError, ZeroDivisionError, OverflowError):
+            continue
+        if k in cache:
+            hits += 1
+        else:
+            try:
+                cache[k] = calc.compile_expression(expression).evaluate()
+            except (ValueError, ZeroDivisionError, OverflowError):
+                cache[k] = None
+
+    return hits / max(1, len(expressions)), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--file", default=HISTORY_FILE,
+                        help=f"history file to replay (default: {HISTORY_FILE})")
+    parser.add_argument("--lines", type=int, default=20_000,
+                        help="size of the generated corpus when there is no history (default: 20000)")
+    args = parser.parse_args()
+
+    calc = load_calculator()
+    if os.path.exists(args.file):
+        expressions = read_history(args.file)
+        source = args.file
+    else:
+        expressions = generate_corpus(args.lines)
+        source = "generated corpus"
+
+    print(f"{len(expressions)} expressions from {source}\n")
+    print(f"{'key':>10} {'hit rate':>9} {'seconds':>8}")
+
+    for name, key in [("text", calc.normalize_expression),
+                      ("canonical", lambda text: calc.compile_expression(text).key or calc.normalize_expression(text))]:
+        hit_rate, seconds = replay(calc, expressions, key)
+        print(f"{name:>10} {hit_rate:>9.1%} {seconds:>8.2f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
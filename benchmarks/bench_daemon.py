@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Daemon client latency benchmark
+
+Compares the per-call cost of starting the calculator for each
+expression with calling calc-client.py, which forwards the expression to
+a warm daemon over a Unix socket. Also reports the bare interpreter
+startup floor and the socket round trip alone.
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from calc_loader import CALCULATOR_PATH
+
+CLIENT_PATH = os.path.join(os.path.dirname(CALCULATOR_PATH), "calc-client.py")
+EXPRESSION = "sqrt(2) * sin(0.5) + 3 % 2"
+
+
+def time_command(command, calls, **options):
+    """Return the mean seconds taken by one run of command"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, **options)
+    return (time.perf_counter() - start) / calls
+
+
+def time_round_trip(path, calls):
+    """Return the mean seconds for one request on an open daemon connection"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    responses = client.makefile("rb")
+    request = f"{EXPRESSION}\n".encode()
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        client.sendall(request)
+        responses.readline()
+    seconds = (time.perf_counter() - start) / calls
+
+    responses.close()
+    client.close()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=30,
+                        help="process launches per mode (default: 30)")
+    parser.add_argument("--round-trips", type=int, default=10_000,
+                        help="requests sent over one connection (default: 10000)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "calc.sock")
+        environment = dict(os.environ, CALC_SOCKET=path)
+        daemon = subprocess.Popen([sys.executable, CALCULATOR_PATH, "--daemon", path])
+        try:
+            while not os.path.exists(path) and daemon.poll() is None:
+                time.sleep(0.01)
+            subprocess.run([sys.executable, "-S", CLIENT_PATH, "1"], env=environment,
+                           check=True, stdout=subprocess.DEVNULL)
+            rows = [
+                ("process per call", time_command([sys.executable, CALCULATOR_PATH, "--batch"],
+                                                  args.calls, input=EXPRESSION, text=True)),
+                ("client (python -S)", time_command([sys.executable, "-S", CLIENT_PATH, EXPRESSION],
+                                                    args.calls, env=environment)),
+                ("interpreter floor", time_command([sys.executable, "-S", "-c", "pass"], args.calls)),
+                ("socket round trip", time_round_trip(path, args.round_trips)),
+            ]
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    print(f"{'mode':>20} {'ms/call':>9}")
+    for label, seconds in rows:
+        print(f"{label:>20} {seconds * 1e3:>9.3f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+NDJSON coprocess throughput benchmark
+
+Drives one long-lived --ndjson calculator process in lockstep (one
+request in flight) and pipelined (every request written before the
+responses are read), and reports requests per second for each.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from calc_loader import CALCULATOR_PATH
+
+
+def requests(count):
+    """Return count encoded requests of a few recurring shapes"""
+    return [json.dumps({"id": i, "expr": f"sqrt({i % 50}.5) * x + {i % 7}", "vars": {"x": i}}).encode() + b"\n"
+            for i in range(count)]
+
+
+def lockstep(process, lines):
+    """Send each request and wait for its response before the next"""
+    for line in lines:
+        process.stdin.write(line)
+        process.stdin.flush()
+        process.stdout.readline()
+
+
+def pipelined(process, lines):
+    """Write every request from a thread while reading the responses"""
+    def write():
+        for line in lines:
+            process.stdin.write(line)
+        process.stdin.flush()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    for _ in lines:
+        process.stdout.readline()
+    writer.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000,
+                        help="requests per mode (default: 20000)")
+    args = parser.parse_args()
+
+    lines = requests(args.requests)
+    process = subprocess.Popen([sys.executable, CALCULATOR_PATH, "--ndjson"],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        lockstep(process, lines[:100])  # warm the caches
+        print(f"{'mode':>10} {'requests/s':>11}")
+        for label, drive in (("lockstep", lockstep), ("pipelined", pipelined)):
+            start = time.perf_counter()
+            drive(process, lines)
+            print(f"{label:>10} {len(lines) / (time.perf_counter() - start):>11.0f}")
+    finally:
+        process.stdin.close()
+        process.wait()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Parallel batch scaling benchmark
+
+Runs the calculator's --batch mode over a generated expression file with
+increasing --jobs counts and reports wall time, speedup and parallel
+efficiency relative to the first (normally single-process) run.
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from calc_loader import CALCULATOR_PATH
+
+
+def write_expressions(path, count, seed=0):
+    """Write count function-heavy expressions, one per line"""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for _ in range(count):
+            terms = [f"sin({rng.uniform(0, 10):.4f})*sqrt({rng.uniform(1, 100):.3f})"
+                     for _ in range(rng.randint(5, 15))]
+            f.write(" + ".join(terms) + "\n")
+
+
+def run(path, jobs, ordered):
+    """Return the seconds taken by one batch run"""
+    command = [sys.executable, CALCULATOR_PATH, "--batch", path, "--jobs", str(jobs)]
+    if not ordered:
+        command.append("--unordered")
+
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=500_000,
+                        help="number of expressions to evaluate (default: 500000)")
+    parser.add_argument("--jobs", default="1,2,4,8,16,32",
+                        help="comma-separated worker counts (default: 1,2,4,8,16,32)")
+    parser.add_argument("--unordered", action="store_true",
+                        help="benchmark unordered output instead of ordered output")
+    args = parser.parse_args()
+
+    job_counts = [int(jobs) for jobs in args.jobs.split(",")]
+    print(f"{args.lines} lines, {os.cpu_count()} CPUs, "
+          f"{'unordered' if args.unordered else 'ordered'} output\n")
+    print(f"{'jobs':>5} {'seconds':>9} {'speedup':>8} {'efficiency':>11}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "expressions.txt")
+        write_expressions(path, args.lines)
+
+        baseline = None
+        for jobs in job_counts:
+            seconds = run(path, jobs, not args.unordered)
+            if baseline is None:
+                baseline = seconds
+            speedup = baseline / seconds
+            efficiency = speedup / (jobs / job_counts[0])
+            print(f"{jobs:>5} {seconds:>9.2f} {speedup:>7.2f}x {efficiency:>10.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+HTTP service latency benchmark
+
+Compares evaluating expressions by starting the calculator once per
+expression (--batch on a pipe) with sending them to a running --serve
+instance over one keep-alive connection, one request at a time and as
+JSON batches.
+"""
+
+import argparse
+import http.client
+import json
+import subprocess
+import sys
+import time
+
+from calc_loader import CALCULATOR_PATH
+from generate_workload import read_corpus, request
+
+
+def expressions(count, corpus=None):
+    """Return count expressions from corpus, or of one shape without a corpus"""
+    if corpus:
+        return [corpus[i % len(corpus)] for i in range(count)]
+    return [f"sqrt({i}.5) * sin(1) + {i} % 7" for i in range(count)]
+
+
+def time_subprocess(texts):
+    """Return seconds per expression when starting one process per expression"""
+    start = time.perf_counter()
+    for text in texts:
+        subprocess.run([sys.executable, CALCULATOR_PATH, "--batch"],
+                       input=text, text=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) / len(texts)
+
+
+def post(connection, path, payload):
+    """Send one JSON request and return the decoded response"""
+    connection.request("POST", path, json.dumps(payload),
+                       {"Content-Type": "application/json"})
+    return json.loads(connection.getresponse().read())
+
+
+def time_requests(port, texts, batch_size):
+    """Return seconds per expression over one keep-alive connection"""
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    requests = [request(number, text) for number, text in enumerate(texts)]
+    start = time.perf_counter()
+
+    if batch_size == 1:
+        for item in requests:
+            post(connection, "/evaluate" if "expr" in item else "/convert", item)
+    else:
+        for i in range(0, len(requests), batch_size):
+            post(connection, "/batch", requests[i:i + batch_size])
+
+    seconds = time.perf_counter() - start
+    connection.close()
+    return seconds / len(texts)
+
+
+def wait_for_server(port, attempts=100):
+    """Poll /health until the server answers"""
+    for _ in range(attempts):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+            connection.request("GET", "/health")
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="expressions sent to the server (default: 2000)")
+    parser.add_argument("--spawns", type=int, default=20,
+                        help="expressions evaluated with one process each (default: 20)")
+    parser.add_argument("--corpus", metavar="FILE",
+                        help="send the lines of FILE (see generate_workload.py) instead of one shape")
+    parser.add_argument("--port", type=int, default=8766,
+                        help="port for the temporary server (default: 8766)")
+    parser.add_argument("--jobs", type=int, default=2,
+                        help="server worker processes (default: 2)")
+    args = parser.parse_args()
+
+    server = subprocess.Popen([sys.executable, CALCULATOR_PATH, "--serve", str(args.port),
+                               "--jobs", str(args.jobs)], stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(args.port)
+        print(f"{'mode':>20} {'us/expression':>14}")
+        corpus = read_corpus(args.corpus) if args.corpus else None
+        rows = [("process per call", time_subprocess(expressions(args.spawns, corpus)))]
+        for batch_size in (1, 100):
+            label = "keep-alive" if batch_size == 1 else f"batch of {batch_size}"
+            texts = expressions(args.requests, corpus)
+            rows.append((label, time_requests(args.port, texts, batch_size)))
+        for label, seconds in rows:
+            print(f"{label:>20} {seconds * 1e6:>14.1f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
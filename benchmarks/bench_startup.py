@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for one-shot evaluation
+
+Times `cli-calculator.py -c EXPR` against a bare interpreter, totals the
+import time it adds (python -X importtime), and checks that modules only
+needed by other modes are not imported. A script run directly is
+compiled from source on every launch, so that cost is measured
+separately and left out of the wall-clock budget. Exits with status 1
+if the one-shot path exceeds the import or wall-clock budget or imports
+a module it should not, so it can guard against startup regressions.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from calc_loader import CALCULATOR_PATH
+
+EXPRESSION = "2+2"
+
+# Modules that belong to other modes and must stay out of a one-shot run
+FORBIDDEN_MODULES = ("argparse", "ast", "asyncio", "datetime", "json", "multiprocessing",
+                     "concurrent", "socket", "tempfile", "urllib", "numpy")
+
+
+def imports(command):
+    """Return {top-level module: cumulative microseconds} imported by command"""
+    output = subprocess.run([sys.executable, "-X", "importtime"] + command, check=True,
+                            capture_output=True, text=True).stderr
+    modules = {}
+    for line in output.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        indent = len(name) - len(name.lstrip())
+        modules.setdefault(name.strip(), (indent, int(fields[1])))
+    return {name: micros for name, (indent, micros) in modules.items() if indent == 1}, set(modules)
+
+
+def wall_time(command, runs):
+    """Return the median seconds taken by command over runs runs"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + command, check=True, stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def compile_time(runs):
+    """Return the median milliseconds Python takes to compile the calculator's source"""
+    with open(CALCULATOR_PATH) as f:
+        source = f.read()
+
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        compile(source, CALCULATOR_PATH, "exec")
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20,
+                        help="launches timed per command (default: 20)")
+    parser.add_argument("--max-import-ms", type=float, default=30.0,
+                        help="import time the calculator may add to the interpreter's (default: 30)")
+    parser.add_argument("--max-overhead-ms", type=float, default=50.0,
+                        help="wall-clock time -c may add to a bare interpreter and the "
+                             "source compile (default: 50)")
+    args = parser.parse_args()
+
+    one_shot = [CALCULATOR_PATH, "-c", EXPRESSION]
+    environment_home = os.environ.get("HOME")
+    baseline, _ = imports(["-c", "pass"])
+    added, loaded = imports(one_shot)
+    added = {name: micros for name, micros in added.items() if name not in baseline}
+    import_ms = sum(added.values()) / 1000
+
+    floor = wall_time(["-c", "pass"], args.runs)
+    wall = wall_time(one_shot, args.runs)
+    compile_ms = compile_time(args.runs)
+    overhead_ms = (wall - floor) * 1000 - compile_ms
+
+    print(f"one-shot '{EXPRESSION}' with HOME={environment_home}\n")
+    print("slowest imports added by the calculator:")
+    for name, micros in sorted(added.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {name:<30} {micros / 1000:>7.2f} ms")
+    print(f"\n{'import time':<22} {import_ms:>8.2f} ms  (budget {args.max_import_ms:g})")
+    print(f"{'interpreter floor':<22} {floor * 1000:>8.2f} ms")
+    print(f"{'source compile':<22} {compile_ms:>8.2f} ms")
+    print(f"{'one-shot':<22} {wall * 1000:>8.2f} ms")
+    print(f"{'overhead':<22} {overhead_ms:>8.2f} ms  (budget {args.max_overhead_ms:g})")
+
+    failures = []
+    forbidden = sorted(name for name in loaded
+                       if name.split(".")[0] in FORBIDDEN_MODULES)
+    if forbidden:
+        failures.append(f"imports modules of other modes: {', '.join(forbidden)}")
+    if import_ms > args.max_import_ms:
+        failures.append(f"import time {import_ms:.2f} ms exceeds {args.max_import_ms:g} ms")
+    if overhead_ms > args.max_overhead_ms:
+        failures.append(f"overhead {overhead_ms:.2f} ms exceeds {args.max_overhead_ms:g} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Streaming evaluation benchmark
+
+Evaluates generated sums of products of increasing length with
+evaluate_stream() and checks that time per token stays flat (linear
+total time) and that peak memory does not grow with input size.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from calc_loader import load_calculator
+
+TOKENS_PER_TERM = 4  # "a", "*", "b", "+"
+SIZE_SUFFIXES = {"K": 1_000, "M": 1_000_000}
+
+
+def generate_chunks(tokens, chunk_size=1 << 16):
+    """Yield text chunks of a sum of products with about `tokens` tokens"""
+    terms = max(1, tokens // TOKENS_PER_TERM)
+    parts = []
+    length = 0
+
+    for i in range(terms):
+        term = f"{i % 97 + 0.5}*{i % 13 + 1}+" if i < terms - 1 else f"{i % 97 + 0.5}*{i % 13 + 1}"
+        parts.append(term)
+        length += len(term)
+        if length >= chunk_size:
+            yield "".join(parts)
+            parts = []
+            length = 0
+
+    if parts:
+        yield "".join(parts)
+
+
+def parse_sizes(text):
+    """Parse comma-separated token counts such as '100K,1M,2500000'"""
+    sizes = []
+    for size in text.split(","):
+        size = size.strip()
+        scale = SIZE_SUFFIXES.get(size[-1:].upper(), 1)
+        try:
+            tokens = int(size[:-1] if scale > 1 else size) * scale
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid size {size!r}") from None
+        if tokens < 1:
+            raise argparse.ArgumentTypeError(f"size must be positive, got {size!r}")
+        sizes.append(tokens)
+    return sizes
+
+
+def time_stream(calc, tokens):
+    """Return the seconds taken to stream-evaluate an input of `tokens` tokens"""
+    start = time.perf_counter()
+    calc.evaluate_stream(generate_chunks(tokens))
+    return time.perf_counter() - start
+
+
+def peak_memory(calc, tokens):
+    """Return the peak traced allocation while stream-evaluating `tokens` tokens"""
+    tracemalloc.start()
+    calc.evaluate_stream(generate_chunks(tokens))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=parse_sizes, default="1M,2M,5M,10M",
+                        help="comma-separated token counts, with an optional K or M suffix "
+                             "(default: 1M,2M,5M,10M)")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="maximum allowed ratio between the slowest and fastest "
+                             "per-token time (default: 1.5)")
+    args = parser.parse_args()
+
+    calc = load_calculator()
+    sizes = args.sizes
+
+    print(f"{'tokens':>12} {'seconds':>10} {'ns/token':>10}")
+    per_token = []
+    for tokens in sizes:
+        seconds = time_stream(calc, tokens)
+        per_token.append(seconds / tokens * 1e9)
+        print(f"{tokens:>12} {seconds:>10.3f} {per_token[-1]:>10.1f}")
+
+    small, large = min(sizes) // 5, min(sizes)
+    small_peak, large_peak = peak_memory(calc, small), peak_memory(calc, large)
+    print(f"\nPeak memory: {small_peak / 1024:.0f} KiB for {small} tokens, "
+          f"{large_peak / 1024:.0f} KiB for {large} tokens")
+
+    ratio = max(per_token) / min(per_token)
+    print(f"Per-token time ratio: {ratio:.2f} (tolerance {args.tolerance})")
+
+    if ratio > args.tolerance:
+        print("FAIL: evaluation time is not linear in input size")
+        return 1
+    if large_peak > small_peak * 2:
+        print("FAIL: peak memory grows with input size")
+        return 1
+
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark suite
+
+Times tokenize(), evaluate() over expression sizes and shapes (long
+chains, deep nesting, function-heavy), convert_units(), save_history()
+and load_history() over history files of increasing length, and writes
+the results as JSON. The compare command checks a results file against
+a stored baseline and exits with status 1 if any benchmark regressed.
+
+    python bench_suite.py run --output baseline.json
+    python bench_suite.py run --output current.json
+    python bench_suite.py compare baseline.json current.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from calc_loader import load_calculator
+from generate_workload import read_corpus
+
+FUNCTIONS = ("sin", "cos", "tan", "sqrt", "log", "ln", "abs")
+HISTORY_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+FULL_HISTORY_SIZES = HISTORY_SIZES + (10_000_000,)
+
+
+def chain(terms):
+    """Return a flat sum/product chain of terms operands"""
+    operators = "+-*+"
+    parts = ["1.5"]
+    for i in range(1, terms):
+        parts.append(operators[i % 4])
+        parts.append(f"{i % 97 + 1}.5")
+    return "".join(parts)
+
+
+def nested(depth):
+    """Return an expression nested depth parentheses deep"""
+    return "(" * depth + "1.5" + "".join(f"+{i % 9 + 1})" for i in range(depth))
+
+
+def function_heavy(calls):
+    """Return a sum of calls function calls with numeric arguments"""
+    return "+".join(f"{FUNCTIONS[i % len(FUNCTIONS)]}({i % 89 + 1}.25)" for i in range(calls))
+
+
+EXPRESSIONS = {
+    "short": "2 * (3 + 4) - 5 / 2",
+    "chain-10": chain(10),
+    "chain-100": chain(100),
+    "chain-1000": chain(1000),
+    "nested-10": nested(10),
+    "nested-100": nested(100),
+    "nested-500": nested(500),
+    "functions-10": function_heavy(10),
+    "functions-100": function_heavy(100),
+}
+
+
+def measure(function, repeat=5, min_time=0.2):
+    """Time function like timeit: return per-call seconds for each repeat"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - start) / number)
+    return number, samples
+
+
+@contextmanager
+def caches_disabled(calc):
+    """Evaluate from scratch: no result, template or disk cache"""
+    caches = (calc.RESULT_CACHE, calc.TEMPLATE_CACHE, calc.DISK_CACHE)
+    states = [cache.enabled for cache in caches]
+    for cache in caches:
+        cache.enabled = False
+    try:
+        yield
+    finally:
+        for cache, state in zip(caches, states):
+            cache.enabled = state
+
+
+@contextmanager
+def temporary_home():
+    """Point ~ at an empty temporary directory"""
+    previous = os.environ.get("HOME")
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+        try:
+            yield home
+        finally:
+            if previous is None:
+                del os.environ["HOME"]
+            else:
+                os.environ["HOME"] = previous
+
+
+def write_history(home, lines):
+    """Write a history file of lines entries under home"""
+    directory = os.path.join(home, ".calc_history")
+    os.makedirs(directory, exist_ok=True)
+    entry = "2024-01-01 12:00:00 | sqrt(2) * 3 + 1 = 5.242640687119285\n"
+    block = entry * 10_000
+    with open(os.path.join(directory, "history.txt"), "w") as f:
+        for _ in range(lines // 10_000):
+            f.write(block)
+        f.write(entry * (lines % 10_000))
+
+
+def evaluate_all(calc, lines):
+    """Evaluate every line of a corpus, counting failures as results"""
+    for line in lines:
+        try:
+            calc.evaluate_line(line)
+        except Exception:
+            pass
+
+
+def cases(calc, history_sizes, corpus=None):
+    """Yield (name, function, setup context) for every benchmark"""
+    for name, text in EXPRESSIONS.items():
+        yield f"tokenize/{name}", lambda text=text: calc.tokenize(text), None
+
+    for name, text in EXPRESSIONS.items():
+        yield f"evaluate/{name}", lambda text=text: calc.evaluate(text), caches_disabled(calc)
+
+    for name in ("short", "chain-100", "functions-10"):
+        text = EXPRESSIONS[name]
+        yield f"evaluate-cached/{name}", lambda text=text: calc.evaluate(text), None
+
+    for value, source, target in ((100, "c", "f"), (5, "km", "mi"), (2, "kg", "lb")):
+        yield (f"convert_units/{source}-{target}",
+               lambda args=(value, source, target): calc.convert_units(*args), None)
+
+    if corpus:
+        yield "corpus/cold", lambda: evaluate_all(calc, corpus), caches_disabled(calc)
+        yield "corpus/cached", lambda: evaluate_all(calc, corpus), None
+
+    yield "save_history/append", lambda: calc.save_history("2 + 2", 4), temporary_home()
+
+    for lines in history_sizes:
+        yield f"load_history/{lines}", calc.load_history, temporary_home()
+
+
+def run(arguments):
+    """Run the benchmarks and write the JSON report"""
+    calc = load_calculator()
+    sizes = FULL_HISTORY_SIZES if arguments.full else HISTORY_SIZES
+    repeat = 3 if arguments.quick else 5
+    min_time = 0.05 if arguments.quick else 0.2
+    results = {}
+
+    corpus = read_corpus(arguments.corpus) if arguments.corpus else None
+
+    for name, function, context in cases(calc, sizes, corpus):
+        if arguments.filter and arguments.filter not in name:
+            continue
+
+        with context or nullcontext() as home:
+            if name.startswith("load_history/"):
+                write_history(home, int(name.split("/")[1]))
+            calc.evaluate("0")  # Warm up the module before timing
+            number, samples = measure(function, repeat, min_time)
+
+        results[name] = {
+            "seconds": min(samples),
+            "mean": statistics.mean(samples),
+            "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            "number": number,
+            "repeat": repeat,
+        }
+        print(f"{name:<32} {min(samples) * 1e6:>12.2f} us", file=sys.stderr)
+
+    report = {
+        "metadata": {
+            "calculator_version": calc.__version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+    if arguments.corpus:
+        report["metadata"]["corpus"] = {"path": arguments.corpus, "lines": len(corpus)}
+    text = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+def compare(arguments):
+    """Print current results against the baseline and count regressions"""
+    with open(arguments.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(arguments.current) as f:
+        current = json.load(f)["results"]
+
+    threshold = arguments.threshold
+    regressions = 0
+    print(f"{'benchmark':<32} {'baseline us':>12} {'current us':>12} {'ratio':>7}")
+
+    for name in sorted(baseline.keys() | current.keys()):
+        if name not in baseline or name not in current:
+            print(f"{name:<32} {'only in ' + ('current' if name in current else 'baseline'):>33}")
+            continue
+
+        before, after = baseline[name]["seconds"], current[name]["seconds"]
+        ratio = after / before if before else float("inf")
+        if ratio > 1 + threshold:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 / (1 + threshold):
+            verdict = "improved"
+        else:
+            verdict = ""
+        print(f"{name:<32} {before * 1e6:>12.2f} {after * 1e6:>12.2f} {ratio:>6.2f}x {verdict}")
+
+    if regressions:
+        print(f"\n{regressions} benchmark{'s' if regressions != 1 else ''} slower "
+              f"than the baseline by more than {threshold:.0%}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and write JSON results")
+    run_parser.add_argument("--output", metavar="FILE",
+                            help="write results to FILE instead of stdout")
+    run_parser.add_argument("--filter", metavar="TEXT",
+                            help="only run benchmarks whose name contains TEXT")
+    run_parser.add_argument("--quick", action="store_true",
+                            help="fewer and shorter repeats, for a smoke test")
+    run_parser.add_argument("--corpus", metavar="FILE",
+                            help="also time evaluating every line of FILE (see generate_workload.py)")
+    run_parser.add_argument("--full", action="store_true",
+                            help="include a 10M-line history file (about 600 MB on disk)")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="flag regressions against a baseline")
+    compare_parser.add_argument("baseline", help="results file to compare against")
+    compare_parser.add_argument("current", help="results file to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="slowdown ratio counted as a regression (default: 0.10)")
+    compare_parser.set_defaults(handler=compare)
+
+    arguments = parser.parse_args()
+    return arguments.handler(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Blocked vectorized evaluation benchmark
+
+Compares evaluate_blocked() at several block sizes against unblocked
+evaluation (the whole array as one block) and against the same formula
+written directly with NumPy, reporting wall time and peak memory.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from calc_loader import load_calculator
+
+EXPRESSION = "sqrt(abs(x)) * sin(x*pi/180) + cos(y)^2 - ln(abs(y) + 1) / 4 + x*y"
+
+
+def naive_numpy(np, x, y):
+    """The benchmark expression written as plain NumPy, one temporary per node"""
+    return (np.sqrt(np.abs(x)) * np.sin(x * np.pi / 180) + np.cos(y) ** 2
+            - np.log(np.abs(y) + 1) / 4 + x * y)
+
+
+def measure(function):
+    """Return (seconds, peak bytes) for one call of function"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000_000,
+                        help="number of elements per input array (default: 10M)")
+    parser.add_argument("--blocks", default="1024,4096,16384,65536,262144",
+                        help="comma-separated block sizes to try")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per configuration, best time is reported (default: 3)")
+    args = parser.parse_args()
+
+    calc = load_calculator()
+    np = calc.import_numpy()
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-100, 100, args.size)
+    y = rng.uniform(-100, 100, args.size)
+    variables = {"x": x, "y": y}
+
+    expected = naive_numpy(np, x, y)
+    configurations = [("numpy (naive)", lambda: naive_numpy(np, x, y)),
+                      ("unblocked", lambda: calc.evaluate_blocked(EXPRESSION, variables, None))]
+    for block_size in (int(size) for size in args.blocks.split(",")):
+        configurations.append((f"block {block_size}",
+                               lambda b=block_size: calc.evaluate_blocked(EXPRESSION, variables, b)))
+
+    result = calc.evaluate_blocked(EXPRESSION, variables)
+    if not np.allclose(result.values, expected):
+        print("FAIL: blocked result differs from NumPy")
+        return 1
+
+    print(f"{args.size} elements: {EXPRESSION}\n")
+    print(f"{'configuration':<16} {'seconds':>9} {'peak MiB':>9}")
+    for label, function in configurations:
+        runs = [measure(function) for _ in range(args.repeat)]
+        seconds = min(run[0] for run in runs)
+        peak = max(run[1] for run in runs)
+        print(f"{label:<16} {seconds:>9.3f} {peak / 2**20:>9.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
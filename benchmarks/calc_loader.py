@@ -0,0 +1,22 @@
+"""
+Load cli-calculator.py as a module for the benchmark scripts
+"""
+
+import importlib.util
+import os
+import sys
+
+CALCULATOR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "cli-calculator.py")
+
+
+def load_calculator():
+    """Import the calculator script, which cannot be imported by name"""
+    if "calculator" in sys.modules:
+        return sys.modules["calculator"]
+
+    spec = importlib.util.spec_from_file_location("calculator", CALCULATOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["calculator"] = module
+    spec.loader.exec_module(module)
+    return module
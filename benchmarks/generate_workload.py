@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Synthetic workload generator
+
+Writes a reproducible corpus of expressions and unit conversions for
+benchmarks and load tests. The same seed and options always produce the
+same corpus. Expression size, nesting depth, operator and function mix,
+and the share of repeated lines and conversions are all controllable.
+
+Formats:
+    lines   one expression or 'convert' command per line (--batch input,
+            bench_suite.py --corpus)
+    ndjson  one JSON request per line (--ndjson input, bench_serve.py --corpus)
+    json    a JSON list of requests (the body of POST /batch)
+
+    python generate_workload.py --count 100000 --tokens 5:60 --duplicates 0.3 -o corpus.txt
+"""
+
+import argparse
+import json
+import random
+import sys
+
+FUNCTIONS = ("sin", "cos", "tan", "sqrt", "log", "ln", "abs")
+OPERATORS = ("+", "-", "*", "/", "^", "%")
+CONSTANTS = ("pi", "e")
+UNITS = (
+    ("c", "f", "k"),
+    ("m", "cm", "km", "in", "ft", "mi"),
+    ("kg", "g", "lb", "oz"),
+)
+
+
+def parse_mix(text, names):
+    """Parse 'name:weight,...' into a {name: weight} dict over known names"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition(":")
+        if name not in names:
+            raise argparse.ArgumentTypeError(f"unknown name {name!r}; choose from {' '.join(names)}")
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight {weight!r}") from None
+    return mix
+
+
+def parse_range(text):
+    """Parse 'N' or 'MIN:MAX' into an inclusive (min, max) pair"""
+    low, _, high = text.partition(":")
+    try:
+        bounds = (int(low), int(high or low))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected N or MIN:MAX, got {text!r}") from None
+    if bounds[0] < 1 or bounds[0] > bounds[1]:
+        raise argparse.ArgumentTypeError(f"invalid range {text!r}")
+    return bounds
+
+
+class WorkloadGenerator:
+    """Generates expressions and conversions from a seeded random source
+
+    tokens is the (min, max) number of tokens per expression and depth
+    the maximum nesting of parentheses and function calls. operators and
+    functions map names to relative weights; function_ratio is the
+    chance that an operand is a function call.
+    """
+
+    def __init__(self, seed=0, tokens=(3, 30), depth=4, operators=None, functions=None,
+                 function_ratio=0.2, paren_ratio=0.2, duplicates=0.0, conversions=0.0,
+                 respell=False):
+        self.random = random.Random(seed)
+        self.tokens = tokens
+        self.depth = depth
+        self.operators = operators or {"+": 4, "-": 3, "*": 3, "/": 2, "^": 1, "%": 1}
+        self.functions = functions or dict.fromkeys(FUNCTIONS, 1)
+        self.function_ratio = function_ratio
+        self.paren_ratio = paren_ratio
+        self.duplicates = duplicates
+        self.conversions = conversions
+        self.respell = respell
+        self.history = []
+
+    def choose(self, weights):
+        """Pick a key of weights with probability proportional to its weight"""
+        return self.random.choices(list(weights), list(weights.values()))[0]
+
+    def number(self):
+        """Return a numeric literal or, rarely, a constant"""
+        roll = self.random.random()
+        if roll < 0.05:
+            return self.random.choice(CONSTANTS)
+        if roll < 0.5:
+            return str(self.random.randint(1, 100))
+        return f"{self.random.uniform(0.1, 100):.{self.random.randint(1, 4)}f}"
+
+    def operand(self, depth):
+        """Return a literal, or a function call when the depth allows"""
+        if depth > 0 and self.functions and self.random.random() < self.function_ratio:
+            return f"{self.choose(self.functions)}({self.expression(1, depth - 1)})"
+        return self.number()
+
+    def expression(self, operands, depth):
+        """Return an expression with the given number of operands"""
+        if operands == 1:
+            return self.operand(depth)
+
+        parenthesize = depth > 0 and self.random.random() < self.paren_ratio
+        inner = depth - 1 if parenthesize else depth
+        operator = self.choose(self.operators)
+
+        if operator == "^":
+            # Small integer exponents keep powers from overflowing
+            text = f"{self.expression(operands - 1, inner)}^{self.random.randint(0, 3)}"
+        else:
+            left = self.random.randint(1, operands - 1)
+            text = f"{self.expression(left, inner)}{operator}{self.expression(operands - left, inner)}"
+
+        return f"({text})" if parenthesize else text
+
+    def conversion(self):
+        """Return a 'convert VALUE FROM to TO' command"""
+        source, target = self.random.sample(self.random.choice(UNITS), 2)
+        return f"convert {self.random.uniform(-50, 500):.2f} {source} to {target}"
+
+    def spelling(self, text):
+        """Return text with random spacing and case, if respelling is enabled"""
+        if not self.respell or text.startswith("convert"):
+            return text
+        spaced = "".join(f" {c} " if c in "+-*/^%" and self.random.random() < 0.5 else c
+                         for c in text)
+        return spaced.upper() if self.random.random() < 0.3 else spaced
+
+    def line(self):
+        """Return the next line of the workload"""
+        if self.history and self.random.random() < self.duplicates:
+            return self.spelling(self.random.choice(self.history))
+
+        if self.random.random() < self.conversions:
+            text = self.conversion()
+        else:
+            tokens = self.random.randint(*self.tokens)
+            text = self.expression(max(1, (tokens + 1) // 2), self.depth)
+
+        self.history.append(text)
+        return text
+
+    def lines(self, count):
+        """Yield count workload lines"""
+        for _ in range(count):
+            yield self.line()
+
+
+def request(number, line):
+    """Return the JSON request for a workload line"""
+    if line.startswith("convert "):
+        _, value, source, _, target = line.split()
+        return {"id": number, "value": float(value), "from": source, "to": target}
+    return {"id": number, "expr": line}
+
+
+def line_from_request(item):
+    """Return the workload line for a JSON request"""
+    if "expr" in item:
+        return item["expr"]
+    return f"convert {item['value']} {item['from']} to {item['to']}"
+
+
+def read_corpus(path):
+    """Read a corpus in any of the generator's formats as a list of lines"""
+    with open(path) as f:
+        text = f.read()
+
+    if text.lstrip().startswith("["):
+        return [line_from_request(item) for item in json.loads(text)]
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    if lines and lines[0].lstrip().startswith("{"):
+        return [line_from_request(json.loads(line)) for line in lines]
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=10_000,
+                        help="number of lines (default: 10000)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed (default: 0)")
+    parser.add_argument("--tokens", type=parse_range, default=(3, 30), metavar="N|MIN:MAX",
+                        help="approximate tokens per expression (default: 3:30)")
+    parser.add_argument("--depth", type=int, default=4,
+                        help="maximum nesting of parentheses and calls (default: 4)")
+    parser.add_argument("--operators", type=lambda text: parse_mix(text, OPERATORS),
+                        metavar="OP:WEIGHT,...",
+                        help="operator mix (default: +:4,-:3,*:3,/:2,^:1,%%:1)")
+    parser.add_argument("--functions", type=lambda text: parse_mix(text, FUNCTIONS),
+                        metavar="NAME:WEIGHT,...",
+                        help=f"function mix (default: all of {','.join(FUNCTIONS)} equally)")
+    parser.add_argument("--function-ratio", type=float, default=0.2,
+                        help="chance that an operand is a function call (default: 0.2)")
+    parser.add_argument("--paren-ratio", type=float, default=0.2,
+                        help="chance that a subexpression is parenthesized (default: 0.2)")
+    parser.add_argument("--duplicates", type=float, default=0.0,
+                        help="share of lines repeating an earlier line (default: 0)")
+    parser.add_argument("--respell", action="store_true",
+                        help="vary spacing and case of repeated expressions")
+    parser.add_argument("--conversions", type=float, default=0.0,
+                        help="share of new lines that are unit conversions (default: 0)")
+    parser.add_argument("--format", choices=("lines", "ndjson", "json"), default="lines",
+                        help="output format (default: lines)")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write to FILE instead of stdout")
+    args = parser.parse_args()
+
+    for name in ("function_ratio", "paren_ratio", "duplicates", "conversions"):
+        if not 0 <= getattr(args, name) <= 1:
+            parser.error(f"--{name.replace('_', '-')} must be between 0 and 1")
+
+    generator = WorkloadGenerator(args.seed, args.tokens, args.depth, args.operators,
+                                  args.functions, args.function_ratio, args.paren_ratio,
+                                  args.duplicates, args.conversions, args.respell)
+    lines = generator.lines(args.count)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    with output:
+        if args.format == "lines":
+            output.writelines(f"{line}\n" for line in lines)
+        elif args.format == "ndjson":
+            output.writelines(json.dumps(request(number, line)) + "\n"
+                              for number, line in enumerate(lines, 1))
+        else:
+            json.dump([request(number, line) for number, line in enumerate(lines, 1)], output)
+            output.write("\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+CLI Calculator client
+
+Sends expressions to a calculator daemon (cli-calculator.py --daemon)
+over a Unix socket and prints the results, starting the daemon on first
+use. It imports almost nothing, so a call costs little more than
+interpreter startup; run it with python3 -S to skip site packages too.
+
+Usage:
+    calc-client.py EXPRESSION          evaluate one expression
+    calc-client.py < expressions.txt   evaluate one expression per line
+"""
+
+import os
+import sys
+
+# The C module avoids the enum, selectors and re imports of socket.py
+import _socket
+
+SOCKET_PATH = os.environ.get("CALC_SOCKET") or os.path.expanduser("~/.calc_history/calc.sock")
+CALCULATOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli-calculator.py")
+SPAWN_TIMEOUT = 5.0
+PIPELINE_DEPTH = 256  # lines sent before reading their results
+
+
+def spawn_daemon():
+    """Start a detached daemon listening on SOCKET_PATH"""
+    import subprocess
+
+    subprocess.Popen([sys.executable, CALCULATOR_PATH, "--daemon", SOCKET_PATH],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def try_connect():
+    """Return a socket connected to the daemon, or None if none is listening"""
+    client = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        client.connect(SOCKET_PATH)
+        return client
+    except (FileNotFoundError, ConnectionRefusedError):
+        client.close()
+        return None
+
+
+def connect():
+    """Connect to the daemon, starting it if it is not running"""
+    client = try_connect()
+    if client:
+        return client
+
+    import time
+
+    spawn_daemon()
+    deadline = time.monotonic() + SPAWN_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.01)
+        client = try_connect()
+        if client:
+            return client
+
+    raise OSError(f"Calculator daemon did not start on {SOCKET_PATH}")
+
+
+def main():
+    lines = [" ".join(sys.argv[1:])] if len(sys.argv) > 1 else sys.stdin
+
+    try:
+        client = connect()
+    except OSError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 2
+
+    failures = 0
+    responses = read_lines(client)
+    batch = []
+    for line in lines:
+        batch.append(line.rstrip("\n"))
+        if len(batch) < PIPELINE_DEPTH:
+            continue
+        failures += exchange(client, responses, batch)
+        batch = []
+    if batch:
+        failures += exchange(client, responses, batch)
+
+    client.close()
+    return 1 if failures else 0
+
+
+def read_lines(client):
+    """Yield the lines received on client until the daemon closes it"""
+    buffer = b""
+    while True:
+        data = client.recv(65536)
+        if not data:
+            return
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        yield from lines
+
+
+def exchange(client, responses, batch):
+    """Send a batch of lines, print their results and return the failure count"""
+    client.sendall("".join(f"{line}\n" for line in batch).encode())
+    failures = 0
+
+    for _ in batch:
+        status, _, output = next(responses, b"").decode().partition("\t")
+        if status == "ok":
+            sys.stdout.write(f"{output}\n")
+        else:
+            sys.stderr.write(f"Error: {output or 'daemon closed the connection'}\n")
+            failures += 1
+
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(main())
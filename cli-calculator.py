@@ -4,148 +4,1978 @@ CLI Calculator
 Author: Chiaki
 """
 
+__version__ = "1.1.0"
+
+# Only what evaluation needs is imported here; modes import the rest
+# (argparse, ast, asyncio, json, multiprocessing, ...) when they start,
+# keeping one-shot startup short (see benchmarks/bench_startup.py)
 import sys
 import math
 import re
 import os
-from datetime import datetime
+import mmap
+import codecs
+import itertools
+import functools
+import hashlib
+import marshal
+import operator
+import struct
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+
+
+FUNCTIONS = ('sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'abs')
+CONSTANTS = {'pi': math.pi, 'e': math.e}
+PRECEDENCE = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3, '%': 2}
+
+# Bytecode opcodes: operand and slot opcodes first, then binary operators,
+# then functions, so the interpreter can dispatch on opcode ranges
+OP_CONST = 0
+OP_VAR = 1
+OP_STORE = 2
+OP_LOAD = 3
+OPCODES = {
+    symbol: code
+    for code, symbol in enumerate(('+', '-', '*', '/', '^', '%') + FUNCTIONS, start=4)
+}
+FIRST_BINARY_OPCODE = OPCODES['+']
+FIRST_FUNCTION_OPCODE = OPCODES[FUNCTIONS[0]]
+OPCODE_NAMES = {OP_CONST: 'CONST', OP_VAR: 'VAR', OP_STORE: 'STORE', OP_LOAD: 'LOAD'}
+OPCODE_NAMES.update({
+    OPCODES[symbol]: name
+    for symbol, name in zip('+-*/^%', ('ADD', 'SUB', 'MUL', 'DIV', 'POW', 'MOD'))
+})
+OPCODE_NAMES.update({OPCODES[function]: function.upper() for function in FUNCTIONS})
+
+
+# Master scanner: every character matches exactly one group, so tokens are
+# classified in a single pass and stray characters are reported
+TOKEN_PATTERN = re.compile(r"""
+    (?P<number>\d*\.\d+|\d+)
+  | (?P<name>[a-z_][a-z0-9_]*)
+  | (?P<operator>[-+*/^%])
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<space>\s+)
+  | (?P<error>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+# Characters that always end a token, so text can be split safely after them
+TOKEN_DELIMITERS = ' \t\r\n()+-*/^%'
+
+CHUNK_SIZE = 1 << 16
+
+
+def scan_tokens(expression, offset=0):
+    """Yield (kind, value) tokens with numbers converted and names classified
+
+    Kinds are 'number', 'function', 'constant', 'variable', 'operator',
+    'lparen' and 'rparen'. offset is added to reported error positions.
+    """
+    for match in TOKEN_PATTERN.finditer(expression):
+        kind = match.lastgroup
+        value = match.group()
+
+        if kind == 'number':
+            yield kind, float(value)
+        elif kind == 'name':
+            if value in FUNCTIONS:
+                yield 'function', value
+            elif value in CONSTANTS:
+                yield 'constant', value
+            else:
+                yield 'variable', value
+        elif kind == 'error':
+            position = offset + match.start() + 1
+            raise ValueError(f"Unexpected character {value!r} at position {position}")
+        elif kind != 'space':
+            yield kind, value
+
+
+def tokenize(expression):
+    """Convert a string expression into a list of (kind, value) tokens"""
+    return list(scan_tokens(expression))
+
+
+def scan_stream(chunks):
+    """Yield tokens from an iterable of text chunks without joining them
+
+    Each chunk is only scanned up to its last delimiter; the remainder is
+    carried into the next chunk so tokens split across chunks stay whole.
+    """
+    carry = ''
+    offset = 0
+
+    for chunk in chunks:
+        buffer = carry + chunk
+        cut = max(map(buffer.rfind, TOKEN_DELIMITERS)) + 1
+        yield from scan_tokens(buffer[:cut], offset)
+        carry = buffer[cut:]
+        offset += cut
+
+    yield from scan_tokens(carry, offset)
+
+
+def read_chunks(stream, chunk_size=CHUNK_SIZE):
+    """Yield text chunks from a text, binary or memory-mapped stream"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if not isinstance(chunk, str):
+            chunk = decoder.decode(chunk)
+        yield chunk
+
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def divide(left, right):
+    """Divide two values, rejecting division by zero"""
+    if right == 0:
+        raise ValueError("Division by zero")
+    return left / right
+
+
+def square_root(value):
+    """Square root that rejects negative numbers"""
+    if value < 0:
+        raise ValueError("Cannot take square root of negative number")
+    return math.sqrt(value)
+
+
+def log10(value):
+    """Base-10 logarithm that rejects non-positive numbers"""
+    if value <= 0:
+        raise ValueError("Cannot take log of non-positive number")
+    return math.log10(value)
+
+
+def natural_log(value):
+    """Natural logarithm that rejects non-positive numbers"""
+    if value <= 0:
+        raise ValueError("Cannot take natural log of non-positive number")
+    return math.log(value)
+
+
+BINARY_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': divide,
+    '^': operator.pow,
+    '%': operator.mod,
+}
+
+UNARY_FUNCTIONS = {
+    'sin': math.sin,
+    'cos': math.cos,
+    'tan': math.tan,
+    'sqrt': square_root,
+    'log': log10,
+    'ln': natural_log,
+    'abs': abs,
+}
+
+OPCODE_HANDLERS = [None] * (max(OPCODES.values()) + 1)
+for symbol, code in OPCODES.items():
+    OPCODE_HANDLERS[code] = BINARY_OPERATORS.get(symbol) or UNARY_FUNCTIONS[symbol]
+OPCODE_HANDLERS = tuple(OPCODE_HANDLERS)
+
+# Globals visible to natively compiled expressions. The names are
+# capitalised so they can never collide with (lowercased) variable names.
+NATIVE_NAMESPACE = {
+    '__builtins__': {},
+    'Divide': divide,
+    'Sin': math.sin,
+    'Cos': math.cos,
+    'Tan': math.tan,
+    'Sqrt': square_root,
+    'Log': log10,
+    'Ln': natural_log,
+    'Abs': abs,
+}
+
+# Names of the ast node classes for each operator
+NATIVE_OPERATORS = {
+    '+': 'Add',
+    '-': 'Sub',
+    '*': 'Mult',
+    '^': 'Pow',
+    '%': 'Mod',
+}
+
+
+class TreeBuilder:
+    """Builds hash-consed expression tree nodes for parse()
+
+    Nodes are tuples: ('num', value), ('const', name), ('var', name),
+    ('param', index), ('call', function, argument) and ('op', symbol,
+    left, right). Identical subtrees are built only once and shared,
+    turning the tree into a DAG. Since children are already shared, a
+    node is keyed on the identity of its children, so hashing never
+    walks a subtree. With shapes, the shape_hash() of every node is
+    also kept by id, for canonicalize().
+    """
+
+    def __init__(self, shapes=False):
+        self.nodes = {}
+        self.shapes = {} if shapes else None
+
+    def intern(self, key, node):
+        node = self.nodes.setdefault(key, node)
+        shapes = self.shapes
+        if shapes is not None and id(node) not in shapes:
+            shapes[id(node)] = shape_hash(node, shapes)
+        return node
+
+    def number(self, value):
+        node = ('num', value)
+        # 0.0 == -0.0, so keep the sign in the key to tell them apart
+        return self.intern(node if value else (node, math.copysign(1.0, value)), node)
+
+    def constant(self, name):
+        node = ('const', name)
+        return self.intern(node, node)
+
+    def variable(self, name):
+        node = ('var', name)
+        return self.intern(node, node)
+
+    def parameter(self, index):
+        node = ('param', index)
+        return self.intern(node, node)
+
+    def call(self, function, argument):
+        return self.intern(('call', function, id(argument)), ('call', function, argument))
+
+    def binary(self, symbol, left, right):
+        return self.intern(('op', symbol, id(left), id(right)), ('op', symbol, left, right))
+
+
+class ValueBuilder:
+    """Computes values directly in parse(), so no tree is ever kept"""
+
+    def __init__(self, variables):
+        self.variables = variables
+
+    def number(self, value):
+        return value
+
+    def constant(self, name):
+        return CONSTANTS[name]
+
+    def variable(self, name):
+        if name not in self.variables:
+            raise ValueError(f"Unknown variable: {name}")
+        return self.variables[name]
+
+    def call(self, function, argument):
+        return UNARY_FUNCTIONS[function](argument)
+
+    def binary(self, symbol, left, right):
+        return BINARY_OPERATORS[symbol](left, right)
+
+
+def fold_value(symbol, *arguments):
+    """Apply an operator or function to literal arguments, returning the float or None
+
+    None means the call cannot be folded: it raised (like 1/0) or did
+    not produce a float, so it is left for evaluation time. Successful
+    folds are counted in STATS, as the operator is applied here instead.
+    """
+    try:
+        value = OPCODE_HANDLERS[OPCODES[symbol]](*arguments)
+    except (ValueError, ArithmeticError):
+        return None
+    if not isinstance(value, float):
+        return None
+    if STATS.enabled:
+        STATS.count_fold(symbol)
+    return value
+
+
+class FoldingBuilder(TreeBuilder):
+    """Tree builder that folds constant subtrees while parsing"""
+
+    def constant(self, name):
+        return self.number(CONSTANTS[name])
+
+    def call(self, function, argument):
+        if argument[0] == 'num':
+            folded = fold_value(function, argument[1])
+            if folded is not None:
+                return self.number(folded)
+        return super().call(function, argument)
+
+    def binary(self, symbol, left, right):
+        if left[0] == 'num' and right[0] == 'num':
+            folded = fold_value(symbol, left[1], right[1])
+            if folded is not None:
+                return self.number(folded)
+        return super().binary(symbol, left, right)
+
+
+def reduce_operator(operators, operands, builder):
+    """Combine the top operator with its operands using builder"""
+    if not operators:
+        return
+
+    token = operators.pop()
+
+    if token == '(':
+        return
+
+    if token in FUNCTIONS:
+        if not operands:
+            raise ValueError(f"Not enough operands for {token}")
+        operands.append(builder.call(token, operands.pop()))
+        return
+
+    if len(operands) < 2:
+        raise ValueError("Not enough operands for operator: " + token)
+
+    right = operands.pop()
+    left = operands.pop()
+    operands.append(builder.binary(token, left, right))
+
+
+def exact_reciprocal(value):
+    """Return 1/value when it is exact (value is a power of two), else None"""
+    if value == 0 or not math.isfinite(value):
+        return None
+
+    mantissa, _ = math.frexp(value)
+    reciprocal = 1.0 / value
+    if abs(mantissa) != 0.5 or not math.isfinite(reciprocal) or abs(reciprocal) < sys.float_info.min:
+        return None
+    return reciprocal
+
+
+class SimplifyingBuilder(FoldingBuilder):
+    """Folding builder that also rewrites operations into cheaper equivalents
+
+    Only IEEE-exact rewrites are applied: x^1, x*1, 1*x, x/1 and x-0
+    become x, and division by a power of two becomes multiplication by
+    its exact reciprocal. x^2 becomes x*x, which is the correctly
+    rounded square (libm pow() can be one ulp off). Larger powers are
+    left to pow(), since multiplication chains add rounding. x+0 is
+    kept, since -0.0 + 0.0 is 0.0, and so is x-0 when the zero is -0.0.
+    """
+
+    def binary(self, symbol, left, right):
+        if right[0] == 'num' and left[0] != 'num':
+            value = right[1]
+            if symbol == '^' and value == 2.0:
+                return super().binary('*', left, left)
+            if value == 1.0 and symbol in '*/^':
+                return left
+            if value == 0.0 and symbol == '-' and math.copysign(1.0, value) > 0:
+                return left
+            if symbol == '/':
+                reciprocal = exact_reciprocal(value)
+                if reciprocal is not None:
+                    return super().binary('*', left, self.number(reciprocal))
+
+        elif left[0] == 'num' and right[0] != 'num':
+            if symbol == '*' and left[1] == 1.0:
+                return right
+
+        return super().binary(symbol, left, right)
+
+
+def parse(tokens, builder=None):
+    """Run the Shunting Yard algorithm over (kind, value) tokens
+
+    Tokens may be any iterable, including a generator. Operands are
+    produced by builder, by default a new TreeBuilder. Apart from what
+    the builder keeps, only the operand and operator stacks are held
+    in memory.
+    """
+    if builder is None:
+        builder = TreeBuilder()
+
+    operands = []
+    operators = []
+
+    for kind, value in tokens:
+        if kind == 'number':
+            operands.append(builder.number(value))
+
+        elif kind == 'operator':
+            precedence = PRECEDENCE[value]
+            while (operators and operators[-1] != '(' and
+                   operators[-1] in PRECEDENCE and
+                   PRECEDENCE[operators[-1]] >= precedence):
+                reduce_operator(operators, operands, builder)
+
+            operators.append(value)
+
+        elif kind == 'variable':
+            operands.append(builder.variable(value))
+
+        elif kind == 'param':
+            operands.append(builder.parameter(value))
+
+        elif kind == 'constant':
+            operands.append(builder.constant(value))
+
+        elif kind == 'function' or kind == 'lparen':
+            operators.append(value)
+
+        elif kind == 'rparen':
+            while operators and operators[-1] != '(':
+                reduce_operator(operators, operands, builder)
+
+            if operators and operators[-1] == '(':
+                operators.pop()
+                if operators and operators[-1] in FUNCTIONS:
+                    reduce_operator(operators, operands, builder)
+            else:
+                raise ValueError("Mismatched parentheses")
+
+        else:
+            raise ValueError(f"Unknown token: {value}")
+
+    while operators:
+        reduce_operator(operators, operands, builder)
+
+    if len(operands) != 1:
+        raise ValueError("Invalid expression")
+
+    return operands[0]
+
+
+def count_references(tree):
+    """Count how many parents refer to each node of a hash-consed tree, by id"""
+    references = {}
+    pending = [tree]
+
+    while pending:
+        node = pending.pop()
+        key = id(node)
+        if key in references:
+            references[key] += 1
+        else:
+            references[key] = 1
+            pending.extend(node[2:] if node[0] in ('call', 'op') else ())
+
+    return references
+
+
+# Operators whose operands can be swapped without changing the result
+COMMUTATIVE = ('+', '*')
+
+
+def shape_hash(node, shapes):
+    """Hash one node from its children's hashes in shapes, ignoring operand order
+
+    Parameters all hash alike and commutative operands are sorted, so
+    '#0+x' and 'x+#1' get the same hash. Only numbers are hashed, since
+    str hashes change between processes.
+    """
+    kind = node[0]
+    if kind == 'op':
+        left, right = shapes[id(node[2])], shapes[id(node[3])]
+        if left > right and node[1] in COMMUTATIVE:
+            left, right = right, left
+        return hash((OPCODES[node[1]], left, right))
+    if kind == 'call':
+        return hash((OPCODES[node[1]], shapes[id(node[2])]))
+    if kind == 'num':
+        return hash(node[1])
+    if kind == 'param':
+        return 1
+    return hash((len(kind), int.from_bytes(node[1].encode(), 'little')))
+
+
+def canonicalize(tree, shapes):
+    """Return a canonical key for a tree and its parameters in canonical order
+
+    shapes holds the shape_hash() of every node, as kept by a builder
+    made with shapes=True. Case, spacing and redundant parentheses never
+    reach the tree, and commutative operands are ordered by shape, so
+    spellings such as '2+3', '3 + 2' and '(2+3)' share a key. The tree
+    is written out once in prefix order, shared nodes as references to
+    their first occurrence and parameters labelled in order of
+    appearance; the key is a digest of that text. The second value
+    lists the tree's own parameter indexes in label order.
+    """
+    tokens = []
+    order = []
+    labels = {}
+    numbers = {}
+    pending = [tree]
+
+    while pending:
+        node = pending.pop()
+        if id(node) in numbers:
+            tokens.append(f"@{numbers[id(node)]}")
+            continue
+        numbers[id(node)] = len(numbers)
+
+        kind = node[0]
+        if kind == 'num':
+            tokens.append(repr(node[1]))
+        elif kind == 'param':
+            if node[1] not in labels:
+                labels[node[1]] = len(order)
+                order.append(node[1])
+            tokens.append(f"p{labels[node[1]]}")
+        else:
+            tokens.append(f"{kind[0]}{node[1]}")
+            if kind == 'call':
+                pending.append(node[2])
+            elif kind == 'op':
+                left, right = node[2:]
+                if node[1] in COMMUTATIVE and shapes[id(left)] > shapes[id(right)]:
+                    left, right = right, left
+                pending.extend((right, left))
+
+    text = " ".join(tokens)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest(), order
+
+
+def hoist_folds(tree, parameter_order):
+    """Turn the literal-only subtrees of a template into derived parameters
+
+    With literals hoisted, subtrees such as 2^#0 or pi/#1 can no longer
+    be folded while parsing. Each largest one becomes a new parameter,
+    folded from the others whenever the template is bound (see
+    fold_parameters). Returns the new tree, parameter_order extended
+    with the new parameters, and the folds: parameter_order and the
+    replaced subtrees, or () if nothing was replaced. Only the ancestors
+    of replaced subtrees are copied.
+    """
+    # Bit 1: no variables below, bit 2: some parameter below
+    flags = {}
+    foldable = False
+    pending = [(tree, False)]
+
+    while pending:
+        node, ready = pending.pop()
+        kind = node[0]
+        if id(node) in flags:
+            continue
+        if kind == 'op' or kind == 'call':
+            if not ready:
+                pending.append((node, True))
+                pending.extend((child, False) for child in node[2:])
+                continue
+            left = flags[id(node[2])]
+            right = flags[id(node[3])] if kind == 'op' else left
+            flags[id(node)] = (left & right & 1) | ((left | right) & 2)
+            foldable = foldable or flags[id(node)] == 3
+        else:
+            flags[id(node)] = 3 if kind == 'param' else 0 if kind == 'var' else 1
+
+    if not foldable:
+        return tree, parameter_order, ()
+
+    first_derived = max(parameter_order) + 1
+    subtrees = []
+    rebuilt = {}
+    pending = [(tree, False)]
+
+    while pending:
+        node, ready = pending.pop()
+        kind = node[0]
+        if id(node) in rebuilt:
+            continue
+        if kind in ('op', 'call') and flags[id(node)] == 3:
+            rebuilt[id(node)] = ('param', first_derived + len(subtrees))
+            subtrees.append(node)
+        elif kind in ('op', 'call') and not ready:
+            pending.append((node, True))
+            pending.extend((child, False) for child in node[2:])
+        elif kind in ('op', 'call'):
+            children = tuple(rebuilt[id(child)] for child in node[2:])
+            changed = any(new is not old for new, old in zip(children, node[2:]))
+            rebuilt[id(node)] = (kind, node[1], *children) if changed else node
+        else:
+            rebuilt[id(node)] = node
+
+    order = tuple(parameter_order)
+    derived = tuple(range(first_derived, first_derived + len(subtrees)))
+    return rebuilt[id(tree)], order + derived, (order, tuple(subtrees))
+
+
+def fold_tree(tree, values):
+    """Fold a literal-only tree as FoldingBuilder would, parameters taken from values
+
+    Returns None if any step cannot be folded (see fold_value).
+    """
+    folded = {}
+    pending = [(tree, False)]
+
+    while pending:
+        node, ready = pending.pop()
+        kind = node[0]
+        if id(node) in folded:
+            continue
+        if kind in ('call', 'op') and not ready:
+            pending.append((node, True))
+            pending.extend((child, False) for child in node[2:])
+            continue
+
+        if kind == 'num':
+            value = node[1]
+        elif kind == 'const':
+            value = CONSTANTS[node[1]]
+        elif kind == 'param':
+            value = values[node[1]]
+        elif kind == 'call':
+            value = fold_value(node[1], folded[id(node[2])])
+        else:
+            value = fold_value(node[1], folded[id(node[2])], folded[id(node[3])])
+        if value is None:
+            return None
+        folded[id(node)] = value
+
+    return folded[id(tree)]
+
+
+def fold_parameters(folds, values):
+    """Append the values of a template's folded subtrees to its parameter values
+
+    folds is as returned by hoist_folds() and values are in its
+    parameter order. Returns None if a subtree cannot be folded or folds
+    to a value the simplifier would have rewritten around (see
+    is_inline_literal); the expression must then be compiled without its
+    template.
+    """
+    order, subtrees = folds
+    by_index = dict(zip(order, values))
+    folded = []
+    for subtree in subtrees:
+        value = fold_tree(subtree, by_index)
+        if value is None or is_inline_literal(value):
+            return None
+        folded.append(value)
+    return tuple(values) + tuple(folded)
+
+
+def assemble(tree):
+    """Compile an expression tree into bytecode
+
+    Returns opcodes, constants, variable names, load slots and template
+    parameters. Operands are implicit: every OP_CONST consumes the next
+    constant, every OP_VAR the next variable name and every OP_LOAD the
+    next slot number, in program order. A computed node shared by
+    several parents is stored into the next free slot by OP_STORE the
+    first time it is evaluated and reloaded from there afterwards.
+    Template parameters are constants filled in when binding; they are
+    returned as (constant position, parameter index) pairs.
+    """
+    code = array('B')
+    constants = array('d')
+    names = []
+    loads = array('I')
+    parameters = []
+    slots = {}
+    references = count_references(tree)
+    pending = [(tree, False)]
+
+    while pending:
+        node, ready = pending.pop()
+        kind = node[0]
+
+        if kind == 'num':
+            code.append(OP_CONST)
+            constants.append(node[1])
+        elif kind == 'const':
+            code.append(OP_CONST)
+            constants.append(CONSTANTS[node[1]])
+        elif kind == 'var':
+            code.append(OP_VAR)
+            names.append(node[1])
+        elif kind == 'param':
+            code.append(OP_CONST)
+            parameters.append((len(constants), node[1]))
+            constants.append(0.0)
+        elif ready:
+            code.append(OPCODES[node[1]])
+            if references[id(node)] > 1:
+                code.append(OP_STORE)
+                slots[id(node)] = len(slots)
+        elif id(node) in slots:
+            code.append(OP_LOAD)
+            loads.append(slots[id(node)])
+        else:
+            # Revisit the node once its children have been emitted
+            pending.append((node, True))
+            pending.extend((child, False) for child in reversed(node[2:]))
+
+    return code, constants, tuple(names), loads, tuple(parameters)
+
+
+def count_opcodes(code):
+    """Return (opcode, count) pairs for the operators and functions in code"""
+    data = code.tobytes()
+    return tuple((opcode, data.count(opcode)) for opcode in sorted(set(data))
+                 if opcode >= FIRST_BINARY_OPCODE)
+
+
+class CompiledExpression:
+    """An expression compiled once to bytecode so it can be evaluated many times"""
+
+    __slots__ = ('text', 'code', 'constants', 'names', 'loads', 'parameters', 'key', 'operators',
+                 'folds')
+
+    def __init__(self, text, tree, parameter_order=(), folds=()):
+        self.text = text
+        self.key = None
+        self.folds = folds
+        self.code, self.constants, self.names, self.loads, parameters = assemble(tree)
+        self.operators = count_opcodes(self.code)
+
+        # Number template parameters by their position in parameter_order
+        positions = {index: position for position, index in enumerate(parameter_order)}
+        self.parameters = tuple((slot, positions.get(index, index)) for slot, index in parameters)
+
+    @classmethod
+    def from_record(cls, text, record):
+        """Rebuild a template from the tuple returned by to_record"""
+        compiled = object.__new__(cls)
+        compiled.text = text
+        compiled.key = None
+        code, constants, compiled.names, loads, compiled.parameters, compiled.folds = record
+        compiled.code = array('B', code)
+        compiled.operators = count_opcodes(compiled.code)
+        compiled.constants = array('d', constants)
+        compiled.loads = array('I', loads)
+        return compiled
+
+    def to_record(self):
+        """Return the program as a marshal-friendly tuple"""
+        return (self.code.tobytes(), self.constants.tobytes(), self.names,
+                self.loads.tobytes(), self.parameters, self.folds)
+
+    def __repr__(self):
+        return f"CompiledExpression({self.text!r})"
+
+    def bind(self, text, values, key=None):
+        """Return this template with its parameters set to values
+
+        The bytecode is shared; only the constants are copied. Returns
+        None if the values leave a subtree unfoldable (see fold_parameters).
+        """
+        if self.folds:
+            values = fold_parameters(self.folds, values)
+            if values is None:
+                return None
+
+        bound = object.__new__(CompiledExpression)
+        bound.text = text
+        bound.key = key
+        bound.code = self.code
+        bound.operators = self.operators
+        bound.folds = ()
+        bound.names = self.names
+        bound.loads = self.loads
+        bound.parameters = ()
+        bound.constants = self.constants
+
+        if self.parameters:
+            bound.constants = array('d', self.constants)
+            for position, index in self.parameters:
+                bound.constants[position] = values[index]
+
+        return bound
+
+    def evaluate(self, /, **variables):
+        """Run the bytecode with the given variable values"""
+        try:
+            next_value = iter([variables[name] for name in self.names]).__next__
+        except KeyError as e:
+            raise ValueError(f"Unknown variable: {e.args[0]}") from None
+
+        next_constant = iter(self.constants).__next__
+        next_load = iter(self.loads).__next__
+        handlers = OPCODE_HANDLERS
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        slots = []
+
+        for opcode in self.code:
+            if opcode == OP_CONST:
+                push(next_constant())
+            elif opcode >= FIRST_FUNCTION_OPCODE:
+                stack[-1] = handlers[opcode](stack[-1])
+            elif opcode >= FIRST_BINARY_OPCODE:
+                right = pop()
+                stack[-1] = handlers[opcode](stack[-1], right)
+            elif opcode == OP_VAR:
+                push(next_value())
+            elif opcode == OP_STORE:
+                slots.append(stack[-1])
+            else:
+                push(slots[next_load()])
+
+        return stack[0]
+
+
+def build_native_ast(tree, parameter_order=()):
+    """Lower an expression tree into a Python lambda AST
+
+    The lambda takes the template parameters first, in parameter_order,
+    then the variables. Returns the ast.Expression and the variable
+    names in the order the lambda expects them. Shared subtrees are
+    computed once with an assignment expression and reused by name.
+    """
+    import ast
+
+    parameters = {}
+    temporaries = {}
+    references = count_references(tree)
+    built = []
+    pending = [(tree, False)]
+
+    while pending:
+        node, ready = pending.pop()
+        kind = node[0]
+
+        if kind == 'num':
+            built.append(ast.Constant(node[1]))
+        elif kind == 'const':
+            built.append(ast.Constant(CONSTANTS[node[1]]))
+        elif kind == 'var':
+            index = parameters.setdefault(node[1], len(parameters))
+            built.append(ast.Name(f'V{index}', ast.Load()))
+        elif kind == 'param':
+            built.append(ast.Name(f'P{node[1]}', ast.Load()))
+        elif id(node) in temporaries:
+            built.append(ast.Name(temporaries[id(node)], ast.Load()))
+        elif not ready:
+            pending.append((node, True))
+            pending.extend((child, False) for child in reversed(node[2:]))
+        else:
+            if kind == 'call':
+                function = ast.Name(node[1].capitalize(), ast.Load())
+                value = ast.Call(function, [built.pop()], [])
+            else:
+                right = built.pop()
+                left = built.pop()
+                if node[1] == '/':
+                    # Keep the calculator's own "Division by zero" error
+                    value = ast.Call(ast.Name('Divide', ast.Load()), [left, right], [])
+                else:
+                    value = ast.BinOp(left, getattr(ast, NATIVE_OPERATORS[node[1]])(), right)
+
+            if references[id(node)] > 1:
+                name = temporaries[id(node)] = f'T{len(temporaries)}'
+                value = ast.NamedExpr(ast.Name(name, ast.Store()), value)
+            built.append(value)
+
+    arguments = ast.arguments(
+        posonlyargs=[],
+        args=([ast.arg(f'P{index}') for index in parameter_order]
+              + [ast.arg(f'V{index}') for index in range(len(parameters))]),
+        kwonlyargs=[],
+        kw_defaults=[],
+        defaults=[],
+    )
+    expression = ast.Expression(ast.Lambda(arguments, built[0]))
+    return ast.fix_missing_locations(expression), tuple(parameters)
+
+
+class NativeExpression:
+    """An expression compiled to a Python code object via the ast module"""
+
+    __slots__ = ('text', 'function', 'names', 'key', 'code', 'folds')
+
+    def __init__(self, text, tree, parameter_order=(), folds=()):
+        self.text = text
+        self.key = None
+        self.folds = folds
+        expression, self.names = build_native_ast(tree, parameter_order)
+        self.code = compile(expression, '<expression>', 'eval')
+        self.function = eval(self.code, NATIVE_NAMESPACE)
+
+    @classmethod
+    def from_record(cls, text, record):
+        """Rebuild a template from the tuple returned by to_record"""
+        compiled = object.__new__(cls)
+        compiled.text = text
+        compiled.key = None
+        compiled.code, compiled.names, compiled.folds = record
+        compiled.function = eval(compiled.code, NATIVE_NAMESPACE)
+        return compiled
+
+    def to_record(self):
+        """Return the code object, variable names and folds as a marshal-friendly tuple"""
+        return (self.code, self.names, self.folds)
+
+    def __repr__(self):
+        return f"NativeExpression({self.text!r})"
+
+    def bind(self, text, values, key=None):
+        """Return this template with its parameters set to values, or None (see fold_parameters)"""
+        if self.folds:
+            values = fold_parameters(self.folds, values)
+            if values is None:
+                return None
+
+        bound = object.__new__(NativeExpression)
+        bound.text = text
+        bound.key = key
+        bound.folds = ()
+        bound.code = self.code
+        bound.names = self.names
+        bound.function = functools.partial(self.function, *values) if values else self.function
+        return bound
+
+    def evaluate(self, /, **variables):
+        """Call the compiled function with the given variable values"""
+        try:
+            values = [variables[name] for name in self.names]
+        except KeyError as e:
+            raise ValueError(f"Unknown variable: {e.args[0]}") from None
+
+        return self.function(*values)
+
+
+ENGINES = {
+    'bytecode': CompiledExpression,
+    'native': NativeExpression,
+}
+
+
+def build_tree(text, optimize=True):
+    """Tokenize and parse an expression into an optimized (or plain) tree"""
+    builder = SimplifyingBuilder() if optimize else TreeBuilder()
+    tokens = STATS.measure('tokenize', tokenize, text.lower())
+    return STATS.measure('parse', parse, tokens, builder)
+
+
+class LRUCache:
+    """Size-bounded cache that evicts the least recently used entry"""
+
+    def __init__(self, maxsize=1024, enabled=True):
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss"""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store a value, evicting old entries beyond maxsize"""
+        if self.maxsize <= 0:
+            return
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        """Change the maximum size, evicting entries if needed"""
+        if maxsize < 0:
+            raise ValueError("Cache size cannot be negative")
+
+        self.maxsize = maxsize
+        while len(self.entries) > maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all entries and reset the statistics"""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return a dictionary of cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PhaseStats:
+    """Call counts and cumulative time per evaluation phase
+
+    Phases are timed through measure(), which costs one extra call when
+    disabled. Operators are not timed one by one: evaluating a bytecode
+    expression adds the opcode counts its template computed once at
+    compile time, so the VM loop itself is untouched, and operators
+    applied while folding constants are counted by fold_value().
+    """
+
+    PHASES = ('tokenize', 'parse', 'compile', 'evaluate', 'convert', 'format', 'history')
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.clear()
+
+    def clear(self):
+        """Reset every counter"""
+        self.calls = dict.fromkeys(self.PHASES, 0)
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.operators = {}
+
+    def measure(self, phase, function, /, *args, **kwargs):
+        """Call function, adding the time taken to phase when enabled"""
+        if not self.enabled:
+            return function(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.calls[phase] += 1
+            self.seconds[phase] += time.perf_counter() - start
+
+    def count_operators(self, compiled):
+        """Add the operators one evaluation of a bytecode expression applies"""
+        operators = self.operators
+        # Native expressions run as Python bytecode and have no opcodes to count
+        for opcode, count in getattr(compiled, 'operators', ()):
+            operators[opcode] = operators.get(opcode, 0) + count
+
+    def count_fold(self, symbol):
+        """Add one operator or function applied while folding constants"""
+        opcode = OPCODES[symbol]
+        self.operators[opcode] = self.operators.get(opcode, 0) + 1
+
+    def snapshot(self):
+        """Return the counters as plain data and reset them"""
+        data = (self.calls, self.seconds, self.operators)
+        self.clear()
+        return data
+
+    def merge(self, data):
+        """Add counters returned by snapshot() in another process"""
+        calls, seconds, operators = data
+        for phase in self.PHASES:
+            self.calls[phase] += calls[phase]
+            self.seconds[phase] += seconds[phase]
+        for opcode, count in operators.items():
+            self.operators[opcode] = self.operators.get(opcode, 0) + count
+
+    def report(self):
+        """Return the counters as a printable table"""
+        lines = [f"{'phase':<10} {'calls':>9} {'total ms':>10} {'mean us':>9}"]
+        for phase in self.PHASES:
+            calls, seconds = self.calls[phase], self.seconds[phase]
+            mean = seconds / calls * 1e6 if calls else 0.0
+            lines.append(f"{phase:<10} {calls:>9} {seconds * 1e3:>10.2f} {mean:>9.1f}")
+
+        symbols = {code: symbol for symbol, code in OPCODES.items()}
+        applied = sorted(self.operators.items(), key=lambda item: -item[1])
+        lines.append("operators: " + (", ".join(f"{symbols[opcode]} {count}" for opcode, count in applied)
+                                      or "none"))
+        return "\n".join(lines)
+
+
+STATS = PhaseStats()
+
+
+# Whitespace next to a single-character token never separates two tokens
+SEPARATORS = frozenset('-+*/^%()')
+
+
+def normalize_expression(expression):
+    """Normalize case and whitespace so trivially different inputs share a key
+
+    Whitespace around operators and parentheses is dropped and other
+    runs collapse to one space, since '1 2' and '12' are different.
+    """
+    words = expression.lower().split()
+    if len(words) <= 1:
+        return words[0] if words else ""
+
+    pieces = [words[0]]
+    for previous, word in zip(words, words[1:]):
+        if previous[-1] not in SEPARATORS and word[0] not in SEPARATORS:
+            pieces.append(" ")
+        pieces.append(word)
+    return "".join(pieces)
+
+
+# A number that is not part of a name; matches the tokenizer's numbers
+LITERAL_PATTERN = re.compile(r'(?<![a-z0-9_.])(?:\d*\.\d+|\d+)')
+
+# A name in normalized text; a superset of the variables it can refer to
+IDENTIFIER_PATTERN = re.compile(r'[a-z_][a-z0-9_]*')
+FIXED_NAMES = frozenset(FUNCTIONS) | frozenset(CONSTANTS)
+
+TEMPLATE_CACHE = LRUCache(maxsize=1024)
+
+
+def is_inline_literal(value):
+    """Whether a literal stays in templates because the simplifier uses its value"""
+    return value == 0 or exact_reciprocal(value) is not None
+
+
+def hoist_literals(text):
+    """Replace the literals of normalized text with numbered parameter markers
+
+    Returns the template key and the distinct parameter values. Repeats
+    of a value share a marker, so shared subtrees are still found, and
+    zero and powers of two stay inline (see is_inline_literal).
+    """
+    parameters = {}
+
+    def replace(match):
+        value = float(match.group())
+        if is_inline_literal(value):
+            return match.group()
+        return f"#{parameters.setdefault(value, len(parameters))}"
+
+    return LITERAL_PATTERN.sub(replace, text), list(parameters)
+
+
+def template_tokens(tokens, parameters, count):
+    """Replace hoisted literals in tokens with ('param', index) tokens
+
+    Returns None if the tokens disagree with the count of hoisted
+    literals, in which case the expression is compiled without a template.
+    """
+    indexes = {value: index for index, value in enumerate(parameters)}
+    result = []
+    found = 0
+
+    for kind, value in tokens:
+        if kind == 'number' and not is_inline_literal(value):
+            if value not in indexes:
+                return None
+            result.append(('param', indexes[value]))
+            found += 1
+        else:
+            result.append((kind, value))
+
+    return result if found == count else None
+
+
+class DiskCache:
+    """Size-bounded cache of marshalled values shared by calculator processes
+
+    The file starts with a header, followed by an index sorted by key
+    digest and then the marshalled values. It is memory-mapped on first
+    use and searched in place, so startup never reads the whole cache.
+    New entries are kept in memory until flush(), or until maxsize of
+    them are waiting, and are then merged into the file under a lock and atomically replaces it, evicting the entries
+    least recently used by any process beyond maxsize. Readers keep
+    their mapping of the old file, so they never see a partial write.
+    Values are only valid for one calculator and Python version; a file
+    written by another version, or a damaged one, reads as empty.
+    """
+
+    MAGIC = b'CALCTPL3'
+    HEADER = struct.Struct('<8s16sII')     # magic, version, entry count, clock
+    ENTRY = struct.Struct('<16sIII')       # key digest, offset, length, last use
+
+    def __init__(self, path, maxsize=4096, enabled=True):
+        self.path = path
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.version = hashlib.blake2b(
+            f"{__version__}|{sys.implementation.cache_tag}".encode(), digest_size=16).digest()
+        self.mapping = None
+        self.count = 0
+        self.pending = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        self.open()
+        return self.count + len(self.pending)
+
+    def digest(self, key):
+        """Return the index digest for a cache key"""
+        return hashlib.blake2b(repr(key).encode(), digest_size=16, key=self.version).digest()
+
+    def read_header(self, data):
+        """Return the entry count and clock from a file's header, or None if unusable
+
+        The file is unusable if it was written by another version or is
+        too short to hold the index its header promises.
+        """
+        if len(data) < self.HEADER.size:
+            return None
+        magic, version, count, clock = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC or version != self.version:
+            return None
+        if self.HEADER.size + count * self.ENTRY.size > len(data):
+            return None
+        return count, clock
+
+    def open(self):
+        """Map the cache file if it has not been mapped yet"""
+        if self.mapping is not None:
+            return
+
+        self.mapping = b''
+        self.count = 0
+        try:
+            with open(self.path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return  # Missing or empty file
+
+        header = self.read_header(mapping)
+        if header is None:
+            mapping.close()
+            return
+        self.mapping = mapping
+        self.count = header[0]
+
+    def in_bounds(self, data, count, offset, length):
+        """Whether a value lies between the index and the end of the file"""
+        return self.HEADER.size + count * self.ENTRY.size <= offset <= len(data) - length
+
+    def close(self):
+        """Unmap the cache file so the next lookup sees the latest version"""
+        if isinstance(self.mapping, mmap.mmap):
+            self.mapping.close()
+        self.mapping = None
+
+    def find(self, digest):
+        """Binary search the mapped index for digest, returning (offset, length)"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = self.HEADER.size + middle * self.ENTRY.size
+            key, offset, length, _ = self.ENTRY.unpack_from(self.mapping, position)
+            if key == digest:
+                if not self.in_bounds(self.mapping, self.count, offset, length):
+                    return None
+                return offset, length
+            if key < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss"""
+        digest = self.digest(key)
+        data = self.pending.get(digest)
+
+        if data is None:
+            self.open()
+            found = self.find(digest) if self.count else None
+            if found is None:
+                self.misses += 1
+                return default
+            offset, length = found
+            data = self.mapping[offset:offset + length]
+            self.used.add(digest)
+
+        try:
+            value = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Queue a value to be written by the next flush()
+
+        Once maxsize values are waiting they are flushed at once, so a
+        long-running process does not hold them all in memory.
+        """
+        if self.maxsize <= 0:
+            return
+        try:
+            self.pending[self.digest(key)] = marshal.dumps(value)
+        except ValueError:
+            return  # Not marshallable; such values are simply not persisted
+        if len(self.pending) >= self.maxsize:
+            self.flush()
+
+    def read_entries(self):
+        """Return the file's entries as {digest: [last use, data]} and its clock"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return {}, 0
+
+        header = self.read_header(data)
+        if header is None:
+            return {}, 0
+        count, clock = header
+
+        entries = {}
+        for position in range(self.HEADER.size, self.HEADER.size + count * self.ENTRY.size,
+                              self.ENTRY.size):
+            key, offset, length, last_use = self.ENTRY.unpack_from(data, position)
+            if not self.in_bounds(data, count, offset, length):
+                return {}, 0
+            entries[key] = [last_use, data[offset:offset + length]]
+        return entries, clock
+
+    def write_entries(self, entries, clock):
+        """Atomically replace the file with entries"""
+        keys = sorted(entries)
+        offset = self.HEADER.size + len(keys) * self.ENTRY.size
+        index = []
+        for key in keys:
+            last_use, data = entries[key]
+            index.append(self.ENTRY.pack(key, offset, len(data), last_use))
+            offset += len(data)
+
+        # The lock keeps other writers away from this name
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, self.version, len(keys), clock))
+                f.writelines(index)
+                f.writelines(entries[key][1] for key in keys)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def locked(self, update):
+        """Call update(entries, clock) on the file contents while holding the lock"""
+        try:
+            import fcntl
+        except ImportError:  # Windows: writers rely on the atomic rename alone
+            fcntl = None
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with open(self.path + '.lock', 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries, clock = self.read_entries()
+                update(entries, clock + 1)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+        self.close()
+
+    def flush(self):
+        """Merge new entries into the file, recording recent hits as well
+
+        Hits alone do not rewrite the file, so a run that only reads the
+        cache costs no write.
+        """
+        if not self.enabled or not (self.pending or len(self) > self.maxsize):
+            return
+
+        def update(entries, clock):
+            for key in self.used:
+                if key in entries:
+                    entries[key][0] = clock
+            for key, data in self.pending.items():
+                entries[key] = [clock, data]
+
+            if len(entries) > self.maxsize:
+                by_age = sorted(entries, key=lambda key: entries[key][0])
+                for key in by_age[:len(entries) - self.maxsize]:
+                    del entries[key]
+                    self.evictions += 1
+
+            self.write_entries(entries, clock)
+
+        try:
+            self.locked(update)
+        except (OSError, struct.error) as e:
+            print(f"Warning: Could not save compiled cache: {e}", file=sys.stderr)
+        self.pending.clear()
+        self.used.clear()
+
+    def resize(self, maxsize):
+        """Change the maximum size; the file is trimmed on the next flush()"""
+        if maxsize < 0:
+            raise ValueError("Cache size cannot be negative")
+        self.maxsize = maxsize
+
+    def clear(self):
+        """Drop all entries, including those on disk, and reset the statistics"""
+        self.pending.clear()
+        self.used.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        try:
+            self.locked(lambda entries, clock: self.write_entries({}, clock))
+        except (OSError, struct.error) as e:
+            print(f"Warning: Could not clear compiled cache: {e}", file=sys.stderr)
+
+    def stats(self):
+        """Return a dictionary of cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+DISK_CACHE = DiskCache(os.path.expanduser("~/.calc_history/compiled.cache"))
+
+
+def load_template(text, text_key):
+    """Return a (template, canonical, order) entry from DISK_CACHE, or None"""
+    record = DISK_CACHE.get(text_key)
+    if record is None:
+        return None
+
+    canonical, order = record
+    engine, optimize = text_key[2:]
+    canonical_key = ('canonical', canonical, engine, optimize)
+
+    template = TEMPLATE_CACHE.get(canonical_key) if TEMPLATE_CACHE.enabled else None
+    if template is None:
+        program = DISK_CACHE.get(canonical_key)
+        if program is None:
+            return None
+        template = ENGINES[engine].from_record(text, program)
+        if TEMPLATE_CACHE.enabled:
+            TEMPLATE_CACHE.put(canonical_key, template)
+
+    return template, canonical, order
+
+
+def compile_expression(text, engine='bytecode', optimize=True):
+    """Parse an expression once and return a reusable compiled expression
+
+    The 'bytecode' engine runs a small stack machine and is cheap to
+    build; the 'native' engine takes longer to compile but lets CPython
+    run the arithmetic directly. Expressions too deeply nested for the
+    Python compiler fall back to bytecode. With optimize, constant
+    subtrees such as sqrt(2) are folded at compile time and operations
+    are simplified (see SimplifyingBuilder).
+
+    Numeric literals are hoisted into parameters (see hoist_literals),
+    so expressions that differ only in their numbers share one compiled
+    template in TEMPLATE_CACHE and a cache hit only binds the numbers.
+    Literal-only subtrees of a template are folded when binding instead
+    (see hoist_folds); numbers for which that is not possible get their
+    own compiled expression.
+    Templates are stored under their canonical form (see canonicalize),
+    with the hoisted text as a shortcut to it, and the returned
+    expression's key identifies the canonical expression and numbers.
+    Templates are also kept in DISK_CACHE for later sessions. Expressions
+    without variables are compiled directly, keyed by the canonical form
+    of their folded tree while RESULT_CACHE is enabled; with every cache
+    disabled, all expressions are compiled directly and have no key.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    text = text.lower()
+    if '#' in text or not (TEMPLATE_CACHE.enabled or RESULT_CACHE.enabled or DISK_CACHE.enabled):
+        # '#' is not valid input but would read as a marker in template keys,
+        # and without caches neither templates nor canonical keys are of use
+        return STATS.measure('compile', build_compiled, text, build_tree(text, optimize), engine)
+
+    key, parameters = hoist_literals(normalize_expression(text))
+    if optimize and FIXED_NAMES.issuperset(IDENTIFIER_PATTERN.findall(key)):
+        # Without variables the parser folds everything, which binding a
+        # template would only repeat
+        if not RESULT_CACHE.enabled:
+            return STATS.measure('compile', build_compiled, text, build_tree(text, optimize), engine)
+        builder = SimplifyingBuilder(shapes=True)
+        tree = STATS.measure('parse', parse, STATS.measure('tokenize', tokenize, text), builder)
+        compiled = STATS.measure('compile', build_compiled, text, tree, engine)
+        compiled.key = (canonicalize(tree, builder.shapes)[0], ())
+        return compiled
+
+    text_key = ('text', key, engine, optimize)
+
+    entry = TEMPLATE_CACHE.get(text_key) if TEMPLATE_CACHE.enabled else None
+    if entry is None and DISK_CACHE.enabled:
+        entry = load_template(text, text_key)
+        if entry is not None and TEMPLATE_CACHE.enabled:
+            TEMPLATE_CACHE.put(text_key, entry)
+    if entry is None:
+        tokens = template_tokens(STATS.measure('tokenize', tokenize, text), parameters, key.count('#'))
+        if tokens is None:
+            return STATS.measure('compile', build_compiled, text, build_tree(text, optimize), engine)
+
+        builder = (SimplifyingBuilder if optimize else TreeBuilder)(shapes=True)
+        tree = STATS.measure('parse', parse, tokens, builder)
+        canonical, order = canonicalize(tree, builder.shapes)
+        canonical_key = ('canonical', canonical, engine, optimize)
+
+        template = TEMPLATE_CACHE.get(canonical_key) if TEMPLATE_CACHE.enabled else None
+        if template is None:
+            parameter_order, folds = order, ()
+            if optimize and order:
+                tree, parameter_order, folds = hoist_folds(tree, order)
+            template = STATS.measure('compile', build_compiled, text, tree, engine,
+                                     parameter_order, folds)
+            if TEMPLATE_CACHE.enabled:
+                TEMPLATE_CACHE.put(canonical_key, template)
+            if DISK_CACHE.enabled:
+                DISK_CACHE.put(canonical_key, template.to_record())
+
+        entry = (template, canonical, order)
+        if TEMPLATE_CACHE.enabled:
+            TEMPLATE_CACHE.put(text_key, entry)
+        if DISK_CACHE.enabled:
+            DISK_CACHE.put(text_key, (canonical, order))
+
+    template, canonical, order = entry
+    values = tuple(parameters[index] for index in order)
+    compiled = template.bind(text, values, (canonical, values))
+    if compiled is None:
+        # Compile these numbers on their own so the simplifier sees them
+        exact_key = ('exact', canonical, values, engine, optimize)
+        compiled = TEMPLATE_CACHE.get(exact_key) if TEMPLATE_CACHE.enabled else None
+        if compiled is None:
+            compiled = STATS.measure('compile', build_compiled, text, build_tree(text, optimize), engine)
+            compiled.key = (canonical, values)
+            if TEMPLATE_CACHE.enabled:
+                TEMPLATE_CACHE.put(exact_key, compiled)
+    return compiled
+
+
+def build_compiled(text, tree, engine, parameter_order=(), folds=()):
+    """Build a compiled expression for tree with the given engine"""
+    if engine == 'native':
+        try:
+            return NativeExpression(text, tree, parameter_order, folds)
+        except (RecursionError, MemoryError):
+            pass
+
+    return CompiledExpression(text, tree, parameter_order, folds)
+
+
+def disassemble(compiled):
+    """Return a readable listing of a compiled expression's bytecode"""
+    constants = iter(compiled.constants)
+    names = iter(compiled.names)
+    loads = iter(compiled.loads)
+    stores = 0
+    lines = []
+
+    for index, opcode in enumerate(compiled.code):
+        name = OPCODE_NAMES[opcode]
+        if opcode == OP_CONST:
+            lines.append(f"{index:4}  {name:<6} {next(constants)!r}")
+        elif opcode == OP_VAR:
+            lines.append(f"{index:4}  {name:<6} {next(names)}")
+        elif opcode == OP_STORE:
+            lines.append(f"{index:4}  {name:<6} {stores}")
+            stores += 1
+        elif opcode == OP_LOAD:
+            lines.append(f"{index:4}  {name:<6} {next(loads)}")
+        else:
+            lines.append(f"{index:4}  {name}")
+
+    return "\n".join(lines)
+
+
+def dump_expression(text):
+    """Return the bytecode of an expression before and after optimization"""
+    sections = []
+    for label, optimize in (("Before optimization", False), ("After optimization", True)):
+        compiled = compile_expression(text, optimize=optimize)
+        sections.append(f"{label} ({len(compiled.code)} instructions):\n"
+                        + disassemble(compiled))
+    return "\n\n".join(sections)
+
+
+def evaluate_stream(chunks, /, **variables):
+    """Evaluate an expression given as an iterable of text chunks
+
+    Tokens are scanned and applied as they arrive, so memory grows with
+    the nesting depth of the expression rather than its length.
+    """
+    tokens = scan_stream(chunk.lower() for chunk in chunks)
+    return parse(tokens, ValueBuilder(variables))
+
+
+def evaluate_file(path, /, **variables):
+    """Evaluate an expression stored in a file by streaming a memory map of it"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return evaluate_stream((), **variables)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return evaluate_stream(read_chunks(mapped), **variables)
+
+
+# Element-wise counterparts of the operators and functions, as NumPy ufunc names
+NUMPY_UFUNCS = {
+    '+': 'add',
+    '-': 'subtract',
+    '*': 'multiply',
+    '/': 'divide',
+    '^': 'power',
+    '%': 'remainder',
+    'sin': 'sin',
+    'cos': 'cos',
+    'tan': 'tan',
+    'sqrt': 'sqrt',
+    'log': 'log10',
+    'ln': 'log',
+    'abs': 'absolute',
+}
+
+
+def zero_divisor(np, out, left, right):
+    """Mask the elements whose right operand is zero"""
+    return np.equal(right, 0, out=out)
+
+
+def negative_operand(np, out, value):
+    """Mask the elements whose operand is negative"""
+    return np.less(value, 0, out=out)
+
+
+def non_positive_operand(np, out, value):
+    """Mask the elements whose operand is zero or negative"""
+    return np.less_equal(value, 0, out=out)
+
+
+def fractional_power_of_negative(np, out, base, exponent):
+    """Mask the elements whose power has no real value (NumPy returns NaN)"""
+    np.less(base, 0, out=out)
+    out &= np.floor(exponent) != exponent
+    return out
+
+
+def negative_power_of_zero(np, out, base, exponent):
+    """Mask the elements that raise zero to a negative power (NumPy returns inf)"""
+    np.equal(base, 0, out=out)
+    out &= np.less(exponent, 0)
+    return out
+
+
+# Element-wise domain checks: each mask function marks the elements the
+# scalar operator rejects, with the scalar error message where it has one
+NUMPY_DOMAIN_CHECKS = {
+    '/': ((zero_divisor, "Division by zero"),),
+    '%': ((zero_divisor, "float modulo"),),
+    '^': ((fractional_power_of_negative, "Cannot raise negative number to a fractional power"),
+          (negative_power_of_zero, "0.0 cannot be raised to a negative power")),
+    'sqrt': ((negative_operand, "Cannot take square root of negative number"),),
+    'log': ((non_positive_operand, "Cannot take log of non-positive number"),),
+    'ln': ((non_positive_operand, "Cannot take natural log of non-positive number"),),
+}
+
+# Elements per block in vectorized evaluation: 64K doubles (512 KiB) per
+# scratch buffer keeps the working set cache-resident while amortizing the
+# per-block Python overhead
+VECTOR_BLOCK_SIZE = 1 << 16
+
+VectorResult = namedtuple('VectorResult', ['values', 'invalid', 'errors'])
+
+
+def import_numpy():
+    """Import NumPy on first use, since only vectorized evaluation needs it"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Vectorized evaluation requires NumPy (pip install numpy)") from None
+    return numpy
+
+
+def plan_vectorized(tree):
+    """Schedule a tree's operations for blocked evaluation with reused buffers
+
+    Returns (steps, result, buffer_count, names). Each step is a
+    (symbol, operands, slot) tuple writing into scratch buffer slot, and
+    operands are ('const', value), ('var', name) or ('slot', index).
+    Shared subtrees get one step, and a slot is recycled as soon as its
+    last user has run, so the buffer count follows the tree's shape
+    rather than its size.
+    """
+    references = count_references(tree)
+    operands = {}
+    steps = []
+    free_slots = []
+    buffer_count = 0
+    names = set()
+    pending = [(tree, False)]
+
+    while pending:
+        node, ready = pending.pop()
+        kind = node[0]
+
+        if id(node) in operands:
+            continue
+        elif kind == 'num':
+            operands[id(node)] = ('const', node[1])
+        elif kind == 'const':
+            operands[id(node)] = ('const', CONSTANTS[node[1]])
+        elif kind == 'var':
+            operands[id(node)] = ('var', node[1])
+            names.add(node[1])
+        elif not ready:
+            pending.append((node, True))
+            pending.extend((child, False) for child in reversed(node[2:]))
+        else:
+            arguments = [operands[id(child)] for child in node[2:]]
+            for child, argument in zip(node[2:], arguments):
+                if argument[0] == 'slot':
+                    references[id(child)] -= 1
+                    if references[id(child)] == 0:
+                        free_slots.append(argument[1])
+
+            # Ufuncs are element-wise, so writing over a freed input is safe
+            if free_slots:
+                slot = free_slots.pop()
+            else:
+                slot = buffer_count
+                buffer_count += 1
+
+            steps.append((node[1], arguments, slot))
+            operands[id(node)] = ('slot', slot)
+
+    return steps, operands[id(tree)], buffer_count, names
+
+
+def evaluate_blocked(expression, variables, block_size=0):
+    """Evaluate an expression over NumPy arrays one cache-sized block at a time
+
+    Variables are broadcast together and processed block_size elements
+    at a time through a small pool of reused scratch buffers (see
+    plan_vectorized), so no full-size temporary is made per node. A
+    block_size of 0 uses VECTOR_BLOCK_SIZE as set when called, and None
+    evaluates the whole array as one block. Returns a VectorResult like
+    evaluate_vectorized().
+    """
+    np = import_numpy()
+    steps, result, buffer_count, names = plan_vectorized(build_tree(expression))
+
+    arrays = {}
+    for name in names:
+        if name not in variables:
+            raise ValueError(f"Unknown variable: {name}")
+        arrays[name] = np.asarray(variables[name], dtype=float)
+
+    shape = np.broadcast_shapes(*(values.shape for values in arrays.values()))
+    size = math.prod(shape)
+    inputs = {}
+    for name, values in arrays.items():
+        if values.ndim == 0:
+            inputs[name] = float(values)
+        else:
+            inputs[name] = np.broadcast_to(values, shape).reshape(-1)
+
+    if block_size == 0:
+        block_size = VECTOR_BLOCK_SIZE
+    if block_size is None or block_size > size:
+        block_size = max(size, 1)
+
+    ufuncs = {symbol: getattr(np, name) for symbol, name in NUMPY_UFUNCS.items()}
+    buffers = [np.empty(block_size) for _ in range(buffer_count)]
+    mask_buffer = np.empty(block_size, dtype=bool)
+    values = np.empty(size)
+    errors = {}
+
+    with np.errstate(all='ignore'):
+        for start in range(0, size, block_size):
+            stop = min(start + block_size, size)
+            length = stop - start
+            views = [buffer[:length] for buffer in buffers]
+            block = {
+                name: value if isinstance(value, float) else value[start:stop]
+                for name, value in inputs.items()
+            }
+
+            def resolve(operand):
+                kind, value = operand
+                if kind == 'const':
+                    return value
+                return block[value] if kind == 'var' else views[value]
+
+            for symbol, operands, slot in steps:
+                arguments = [resolve(operand) for operand in operands]
+
+                for check, message in NUMPY_DOMAIN_CHECKS.get(symbol, ()):
+                    mask = check(np, mask_buffer[:length], *arguments)
+                    if mask.any():
+                        if message not in errors:
+                            errors[message] = np.zeros(size, dtype=bool)
+                        errors[message][start:stop] |= mask
+
+                ufuncs[symbol](*arguments, out=views[slot])
+
+            values[start:stop] = resolve(result)
+
+    invalid = np.zeros(size, dtype=bool)
+    for mask in errors.values():
+        invalid |= mask
+    values[invalid] = np.nan
+
+    errors = {message: mask.reshape(shape) for message, mask in errors.items()}
+    return VectorResult(values.reshape(shape), invalid.reshape(shape), errors)
+
+
+def evaluate_vectorized(expression, /, *, block_size=0, **variables):
+    """Evaluate an expression element-wise over NumPy arrays
+
+    Every operator and function maps onto a NumPy ufunc, so each node
+    is one pass of compiled loops over the data, and shared subtrees
+    are computed once. Work is done in cache-sized blocks of block_size
+    elements, VECTOR_BLOCK_SIZE by default (see evaluate_blocked), so
+    block_size cannot be used as a variable name. Variables may be
+    arrays or scalars and are broadcast together. Domain errors do not
+    abort the batch: the result's values are NaN where an element
+    failed, invalid masks the failed elements and errors maps each
+    error message to its own mask.
+    """
+    return evaluate_blocked(expression, variables, block_size)
+
+
+RESULT_CACHE = LRUCache(maxsize=1024)
+
+# Marks a cache miss, since None could never be a cached result
+MISSING = object()
+
+
+def run_compiled(compiled, variables):
+    """Evaluate a compiled expression, recording it in STATS when enabled"""
+    if not STATS.enabled:
+        return compiled.evaluate(**variables)
+
+    result = STATS.measure('evaluate', compiled.evaluate, **variables)
+    STATS.count_operators(compiled)
+    return result
+
+
+def evaluate(expression, /, **variables):
+    """Evaluate a mathematical expression, reusing cached results when enabled
+
+    Results are looked up by normalized text first, then by canonical
+    form (see compile_expression), so 'x + 3' reuses the result of '3+x'.
+    Only the variables named in the expression are part of the cache key,
+    so unrelated ones (such as the REPL's ans) do not cause misses.
+    Variable values are converted to float first, so x=10 and x=10.0
+    give the same result whether or not it was cached.
+    """
+    variables = {name: float(value) for name, value in variables.items()}
+    if not RESULT_CACHE.enabled:
+        return run_compiled(compile_expression(expression), variables)
+
+    text = normalize_expression(expression)
+    bindings = ()
+    if variables:
+        names = set(IDENTIFIER_PATTERN.findall(text))
+        bindings = tuple(sorted(item for item in variables.items() if item[0] in names))
+    text_key = (text, bindings)
 
+    result = RESULT_CACHE.get(text_key, MISSING)
+    if result is not MISSING:
+        return result
 
-def tokenize(expression):
-    """Convert a string expression into tokens"""
+    compiled = compile_expression(expression)
+    canonical_key = (compiled.key, bindings) if compiled.key else None
+    if canonical_key:
+        result = RESULT_CACHE.get(canonical_key, MISSING)
 
-    expression = expression.replace(" ", "")
+    if result is MISSING:
+        result = run_compiled(compiled, variables)
+        if canonical_key:
+            RESULT_CACHE.put(canonical_key, result)
 
-    pattern = r'(\d*\.\d+|\d+|[-+*/()^%]|sin|cos|tan|sqrt|log|ln|abs|pi|e)'
-    tokens = re.findall(pattern, expression)
-    return tokens
+    RESULT_CACHE.put(text_key, result)
+    return result
 
 
-def apply_operator(operators, values):
-    """Apply the top operator to the top two values"""
-    if not operators:
-        return
-    
-    operator = operators.pop()
-    
-    if operator == '(':  
-        return
-    
-    if operator in ('sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'abs'):
-        if not values:
-            raise ValueError(f"Not enough operands for {operator}")
-        
-        value = values.pop()
-        
-        if operator == 'sin':
-            values.append(math.sin(value))
-        elif operator == 'cos':
-            values.append(math.cos(value))
-        elif operator == 'tan':
-            values.append(math.tan(value))
-        elif operator == 'sqrt':
-            if value < 0:
-                raise ValueError("Cannot take square root of negative number")
-            values.append(math.sqrt(value))
-        elif operator == 'log':
-            if value <= 0:
-                raise ValueError("Cannot take log of non-positive number")
-            values.append(math.log10(value))
-        elif operator == 'ln':
-            if value <= 0:
-                raise ValueError("Cannot take natural log of non-positive number")
-            values.append(math.log(value))
-        elif operator == 'abs':
-            values.append(abs(value))
-        return
-    
-    if operator == 'pi':
-        values.append(math.pi)
-        return
-    elif operator == 'e':
-        values.append(math.e)
-        return
+def parse_assignment(text):
+    """Split 'name = expression' into (name, expression), or return None"""
+    name, separator, expression = text.partition('=')
+    if not separator:
+        return None
 
-    if len(values) < 2:
-        raise ValueError("Not enough operands for operator: " + operator)
-    
-    right = values.pop()
-    left = values.pop()
-    
-    if operator == '+':
-        values.append(left + right)
-    elif operator == '-':
-        values.append(left - right)
-    elif operator == '*':
-        values.append(left * right)
-    elif operator == '/':
-        if right == 0:
-            raise ValueError("Division by zero")
-        values.append(left / right)
-    elif operator == '^':
-        values.append(left ** right)
-    elif operator == '%':
-        values.append(left % right)
-
-
-def evaluate(expression):
-    """Evaluate a mathematical expression using the Shunting Yard algorithm"""
-    expression = expression.lower()
-    tokens = tokenize(expression)
-    
-    precedence = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3, '%': 2}
-    
-    values = []
-    operators = []
-    
-    i = 0
-    while i < len(tokens):
-        token = tokens[i]
-        
-        if re.match(r'^(\d*\.\d+|\d+)$', token):
-            values.append(float(token))
-        
-        elif token in ('sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'abs', 'pi', 'e'):
-            operators.append(token)
-        
-        elif token == '(':
-            operators.append(token)
-        
-        elif token == ')':
-            while operators and operators[-1] != '(':
-                apply_operator(operators, values)
-            
-            if operators and operators[-1] == '(':
-                operators.pop() 
-                if operators and operators[-1] in ('sin', 'cos', 'tan', 'sqrt', 'log', 'ln', 'abs'):
-                    apply_operator(operators, values)
-            else:
-                raise ValueError("Mismatched parentheses")
-        
-        elif token in '+-*/^%':
-            while (operators and operators[-1] != '(' and
-                   operators[-1] in precedence and
-                   precedence.get(operators[-1], 0) >= precedence.get(token, 0)):
-                apply_operator(operators, values)
-            
-            operators.append(token)
-        
-        else:
-            raise ValueError(f"Unknown token: {token}")
-        
-        i += 1
-    
-    while operators:
-        apply_operator(operators, values)
-    
-    if len(values) != 1:
-        raise ValueError("Invalid expression")
-    
-    return values[0]
+    name = name.strip().lower()
+    if not re.fullmatch(r'[a-z_][a-z0-9_]*', name):
+        raise ValueError(f"Invalid variable name: {name}")
+    if name in FUNCTIONS or name in CONSTANTS or name == 'ans':
+        raise ValueError(f"Cannot assign to {name}")
+
+    return name, expression
+
+
+def handle_cache_command(arguments):
+    """Handle the 'cache' REPL command, which applies to every cache"""
+    caches = {"Result cache": RESULT_CACHE, "Template cache": TEMPLATE_CACHE,
+              "Disk cache": DISK_CACHE}
+
+    if not arguments or arguments == ['stats']:
+        for label, cache in caches.items():
+            stats = cache.stats()
+            state = "enabled" if stats['enabled'] else "disabled"
+            print(f"{label}: {state}, {stats['size']}/{stats['maxsize']} entries")
+            print(f"  hits: {stats['hits']}  misses: {stats['misses']}  "
+                  f"evictions: {stats['evictions']}  hit rate: {stats['hit_rate']:.1%}")
+    elif arguments in (['on'], ['off']):
+        for cache in caches.values():
+            cache.enabled = arguments == ['on']
+        print(f"Caches {'enabled' if arguments == ['on'] else 'disabled'}")
+    elif arguments == ['clear']:
+        for cache in caches.values():
+            cache.clear()
+        print("Caches cleared")
+    elif len(arguments) == 2 and arguments[0] == 'size' and arguments[1].isdigit():
+        for cache in caches.values():
+            cache.resize(int(arguments[1]))
+        print(f"Cache sizes set to {arguments[1]}")
+    else:
+        print("Usage: cache [stats|on|off|clear|size N]")
+
+
+def handle_stats_command(arguments):
+    """Handle the 'stats' REPL command"""
+    if not arguments:
+        print(STATS.report())
+    elif arguments in (['on'], ['off']):
+        STATS.enabled = arguments == ['on']
+        print(f"Statistics {'enabled' if STATS.enabled else 'disabled'}")
+    elif arguments == ['clear']:
+        STATS.clear()
+        print("Statistics cleared")
+    else:
+        print("Usage: stats [on|off|clear]")
 
 
 def save_history(calculation, result):
     """Save calculation history to a file"""
+    from datetime import datetime
+
     history_dir = os.path.expanduser("~/.calc_history")
     
     if not os.path.exists(history_dir):
@@ -213,6 +2043,703 @@ def convert_units(value, from_unit, to_unit):
     raise ValueError(f"Cannot convert from {from_unit} to {to_unit}")
 
 
+def parse_convert_command(text):
+    """Split 'convert VALUE FROM_UNIT to TO_UNIT' into its parts, or return None"""
+    parts = text.lower().split()
+    if len(parts) != 5 or parts[0] != 'convert' or parts[3] != 'to':
+        return None
+
+    try:
+        value = float(parts[1])
+    except ValueError:
+        raise ValueError(f"Invalid value: {parts[1]}") from None
+
+    return value, parts[2], parts[4]
+
+
+def format_result(result):
+    """Return a result as an int when it is a whole number"""
+    if result == int(result):
+        return int(result)
+    return result
+
+
+def evaluate_line(line):
+    """Evaluate one line of batch input: an expression or a convert command"""
+    if line.lower().startswith('convert '):
+        command = parse_convert_command(line)
+        if command is None:
+            raise ValueError("Usage: convert VALUE FROM_UNIT to TO_UNIT")
+        return STATS.measure('convert', convert_units, *command)
+
+    return STATS.measure('format', format_result, evaluate(line))
+
+
+# Lines per work unit sent to each process in parallel batch mode
+BATCH_CHUNK_SIZE = 1000
+
+
+def batch_key(line):
+    """Return the key under which equivalent batch lines are deduplicated"""
+    if line.lower().lstrip().startswith('convert '):
+        return " ".join(line.lower().split())
+    return normalize_expression(line)
+
+
+def evaluate_batch_line(number, line):
+    """Evaluate a numbered batch line, returning (number, output, error)
+
+    A line of None is a repeat of an earlier line and is not evaluated;
+    both output and error come back as None.
+    """
+    if line is None:
+        return number, None, None
+
+    line = line.strip()
+    if not line:
+        return number, "", None
+
+    try:
+        return number, str(evaluate_line(line)), None
+    except Exception as e:
+        return number, None, str(e)
+
+
+def evaluate_batch_chunk(chunk):
+    """Evaluate a list of (number, line) pairs in a worker process
+
+    Returns the results and, when STATS is enabled, a snapshot of the
+    worker's counters for the parent to merge.
+    """
+    results = [evaluate_batch_line(number, line) for number, line in chunk]
+    return results, STATS.snapshot() if STATS.enabled else None
+
+
+def merge_chunk_results(outcomes):
+    """Yield the results of evaluate_batch_chunk() calls, merging their stats"""
+    for results, stats in outcomes:
+        if stats:
+            STATS.merge(stats)
+        yield from results
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_batch(path, jobs=1, ordered=True, dedupe=True, stats=False):
+    """Evaluate one expression per line from a file or stdin ('-')
+
+    Results are written one line per input line, without prompts or
+    history writes. A failing line is reported inline as
+    'error: line N: message'; if any line fails, a summary goes to
+    stderr and the exit status is 1. With jobs > 1 the input is split
+    into chunks of BATCH_CHUNK_SIZE lines evaluated by a process pool.
+    Output keeps the input order unless ordered is false, in which case
+    results are written as they finish, prefixed by their line number
+    and a tab.
+
+    With dedupe, a line equal to an earlier one up to case and
+    whitespace (see batch_key) is not evaluated again: it travels
+    through the pipeline as a placeholder and receives the earlier
+    line's outcome, and the saving is summarised on stderr.
+
+    With stats, per-phase counters from every process are written to
+    stderr at the end (see PhaseStats).
+    """
+    STATS.enabled = stats
+    try:
+        stream = sys.stdin if path == '-' else open(path)
+    except OSError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 2
+
+    write = sys.stdout.write
+    lines = 0
+    failures = 0
+    repeats = 0
+    keys = {}       # line number -> dedupe key, until its result comes back
+    outcomes = {}   # key -> (output, error) of its first occurrence
+    waiting = {}    # key -> repeats that came back before their first occurrence
+    if jobs > 1:
+        import multiprocessing
+    pool = multiprocessing.Pool(jobs, initializer=start_worker) if jobs > 1 else None
+
+    def distinct_lines(numbered):
+        nonlocal repeats
+        for number, line in numbered:
+            key = batch_key(line) if dedupe else ""
+            if not key:
+                yield number, line
+                continue
+
+            keys[number] = key
+            if key in outcomes or key in waiting:
+                repeats += 1
+                yield number, None
+            else:
+                waiting[key] = []
+                yield number, line
+
+    def emit(number, output, error):
+        nonlocal lines, failures
+        lines += 1
+        if error is not None:
+            failures += 1
+            output = f"error: line {number}: {error}"
+        if ordered:
+            write(f"{output}\n")
+        else:
+            write(f"{number}\t{output}\n")
+
+    try:
+        with stream:
+            numbered = distinct_lines(enumerate(stream, 1))
+            if pool:
+                chunks = chunked(numbered, BATCH_CHUNK_SIZE)
+                mapper = pool.imap if ordered else pool.imap_unordered
+                results = merge_chunk_results(mapper(evaluate_batch_chunk, chunks))
+            else:
+                results = itertools.starmap(evaluate_batch_line, numbered)
+
+            for number, output, error in results:
+                key = keys.pop(number, None)
+                if key is None:
+                    emit(number, output, error)
+                elif output is None and error is None:
+                    if key in outcomes:
+                        emit(number, *outcomes[key])
+                    else:
+                        waiting[key].append(number)
+                else:
+                    emit(number, output, error)
+                    outcomes[key] = (output, error)
+                    for repeat in waiting.pop(key):
+                        emit(repeat, output, error)
+
+        if pool:
+            # Let the workers exit normally so they flush the disk cache
+            pool.close()
+            pool.join()
+    finally:
+        if pool:
+            pool.terminate()
+
+    sys.stdout.flush()
+    if repeats:
+        sys.stderr.write(f"Deduplicated {repeats} of {lines} lines: "
+                         f"evaluated {lines - repeats}, saved {repeats / lines:.1%}\n")
+    if stats:
+        sys.stderr.write(f"{STATS.report()}\n")
+    if failures:
+        sys.stderr.write(f"{failures} of {lines} lines failed\n")
+        return 1
+    return 0
+
+
+def evaluate_request(request, kind=None):
+    """Evaluate one JSON request object, returning a JSON response object
+
+    An expression request is {"expr": TEXT, "vars": {NAME: NUMBER}} with
+    vars optional; a conversion request is {"value": NUMBER, "from":
+    UNIT, "to": UNIT}. kind ('expr' or 'convert') restricts the request
+    to one form. The response is {"result": VALUE} or {"error": MESSAGE}.
+    Numbers are taken and returned as floats, so a JSON integer cannot
+    start unbounded integer arithmetic.
+    """
+    try:
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object")
+
+        if kind != 'convert' and 'expr' in request:
+            expression = request['expr']
+            variables = request.get('vars') or {}
+            if not isinstance(expression, str):
+                raise ValueError("'expr' must be a string")
+            if not isinstance(variables, dict) or not all(
+                    isinstance(value, (int, float)) and not isinstance(value, bool)
+                    for value in variables.values()):
+                raise ValueError("'vars' must map names to numbers")
+            variables = {name: float(value) for name, value in variables.items()}
+            return {"result": evaluate(expression, **variables)}
+
+        if kind != 'expr' and 'value' in request:
+            value, from_unit, to_unit = request['value'], request.get('from'), request.get('to')
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError("'value' must be a number")
+            if not isinstance(from_unit, str) or not isinstance(to_unit, str):
+                raise ValueError("'from' and 'to' must be unit names")
+            return {"result": STATS.measure('convert', convert_units, float(value), from_unit.lower(), to_unit.lower())}
+
+        raise ValueError("Request needs 'expr'" if kind == 'expr' else
+                         "Request needs 'value', 'from' and 'to'" if kind == 'convert' else
+                         "Request needs 'expr' or 'value', 'from' and 'to'")
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def evaluate_requests(requests):
+    """Evaluate a list of JSON request objects in one worker call"""
+    return [evaluate_request(request) for request in requests]
+
+
+# Defaults for --serve
+SERVE_ADDRESS = '127.0.0.1:8765'
+SERVE_TIMEOUT = 5.0         # seconds allowed for one request's evaluation
+KEEPALIVE_TIMEOUT = 15.0    # seconds an idle connection is kept open
+MAX_REQUEST_BODY = 1 << 20
+MAX_HEADERS = 100
+REQUEST_KINDS = {'/evaluate': 'expr', '/convert': 'convert'}
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error',
+    501: 'Not Implemented', 504: 'Gateway Timeout',
+}
+
+
+class HTTPError(Exception):
+    """An error reported to the client with an HTTP status code"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_http_request(reader):
+    """Read one HTTP/1.x request, returning (method, target, body, keep_alive)
+
+    Returns None when the client closes the connection between requests.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+        raise HTTPError(400, "Malformed request line")
+    method, target, version = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, separator, value = line.decode('latin-1').partition(':')
+        if not separator or len(headers) >= MAX_HEADERS:
+            raise HTTPError(400, "Malformed headers")
+        headers[name.strip().lower()] = value.strip()
+
+    if 'transfer-encoding' in headers:
+        raise HTTPError(501, "Chunked request bodies are not supported")
+    length = headers.get('content-length', '0')
+    if not length.isdigit():
+        raise HTTPError(400, "Invalid Content-Length")
+    if int(length) > MAX_REQUEST_BODY:
+        raise HTTPError(413, f"Request body exceeds {MAX_REQUEST_BODY} bytes")
+    body = await reader.readexactly(int(length))
+
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+    return method, target, body, keep_alive
+
+
+def write_http_response(writer, status, payload, keep_alive):
+    """Write a JSON response with the given status"""
+    import json
+
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        f"\r\n".encode('latin-1') + body)
+
+
+def parse_json_body(body):
+    """Decode a JSON request body"""
+    import json
+
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise HTTPError(400, "Request body must be JSON") from None
+
+
+async def dispatch_request(method, target, body, pool, timeout):
+    """Route one request and return (status, payload)
+
+    Evaluation runs in the process pool so a slow expression cannot
+    block the event loop; one that takes longer than timeout seconds
+    gets a 504 response, although its worker finishes the job anyway.
+    """
+    import asyncio
+    from concurrent.futures.process import BrokenProcessPool
+    from urllib.parse import parse_qsl
+
+    path, _, query = target.partition('?')
+
+    if path == '/health':
+        return 200, {"status": "ok"}
+    if path not in REQUEST_KINDS and path != '/batch':
+        raise HTTPError(404, f"Unknown endpoint: {path}")
+
+    if method == 'GET' and path == '/evaluate':
+        fields = dict(parse_qsl(query))
+        try:
+            request = {"expr": fields.pop('expr', None),
+                       "vars": {name: float(value) for name, value in fields.items()}}
+        except ValueError:
+            raise HTTPError(400, "Variables must be numbers") from None
+    elif method == 'POST':
+        request = parse_json_body(body)
+    else:
+        raise HTTPError(405, f"{method} is not allowed on {path}")
+
+    if path == '/batch':
+        requests = request.get('requests') if isinstance(request, dict) else request
+        if not isinstance(requests, list):
+            raise HTTPError(400, "Batch body must be a list of requests")
+        call = (evaluate_requests, requests)
+    else:
+        call = (evaluate_request, request, REQUEST_KINDS[path])
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await asyncio.wait_for(loop.run_in_executor(pool, *call), timeout)
+    except asyncio.TimeoutError:
+        raise HTTPError(504, f"Evaluation took longer than {timeout:g} seconds") from None
+    except BrokenProcessPool:
+        raise HTTPError(500, "Worker process failed") from None
+
+    if path == '/batch':
+        return 200, {"results": result}
+    return (400 if 'error' in result else 200), result
+
+
+async def handle_connection(reader, writer, pool, timeout):
+    """Serve requests on one keep-alive connection until it closes"""
+    import asyncio
+
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_http_request(reader), KEEPALIVE_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                break
+            except ValueError:
+                # A line longer than the stream reader's limit
+                request = HTTPError(400, "Request line or header too long")
+            except HTTPError as e:
+                request = e
+
+            if request is None:
+                break
+            if isinstance(request, HTTPError):
+                write_http_response(writer, request.status, {"error": str(request)}, False)
+                await writer.drain()
+                break
+
+            method, target, body, keep_alive = request
+            try:
+                status, payload = await dispatch_request(method, target, body, pool, timeout)
+            except HTTPError as e:
+                status, payload = e.status, {"error": str(e)}
+
+            write_http_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def start_worker(interrupts=True):
+    """Set up a pool worker process, leaving Ctrl-C to the parent unless interrupts
+
+    The worker's new disk cache entries are flushed when it exits. Pool
+    workers leave through os._exit(), which skips atexit, so the flush
+    is registered with multiprocessing's own exit hooks.
+    """
+    import multiprocessing.util
+    import signal
+
+    if not interrupts:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    multiprocessing.util.Finalize(None, DISK_CACHE.flush, exitpriority=0)
+
+
+async def serve(host, port, jobs, timeout):
+    """Run the HTTP evaluation service until cancelled or terminated"""
+    import asyncio
+    import signal
+    from concurrent.futures import ProcessPoolExecutor
+
+    try:
+        # Shut the worker pool down cleanly on SIGTERM as well as Ctrl-C
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass  # Windows
+
+    with ProcessPoolExecutor(jobs, initializer=start_worker, initargs=(False,)) as pool:
+        server = await asyncio.start_server(
+            functools.partial(handle_connection, pool=pool, timeout=timeout), host, port)
+        address = server.sockets[0].getsockname()
+        sys.stderr.write(f"Serving on http://{address[0]}:{address[1]} "
+                         f"with {jobs} worker process{'es' if jobs != 1 else ''}\n")
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(address, jobs=None, timeout=SERVE_TIMEOUT):
+    """Serve evaluate() and convert_units() over HTTP/1.1 at [HOST:]PORT
+
+    Endpoints take and return JSON (see evaluate_request):
+    POST /evaluate and POST /convert take one request object, GET
+    /evaluate?expr=...&x=1 takes the expression and variables from the
+    query, POST /batch takes a list of requests (or {"requests": [...]})
+    and returns {"results": [...]} in the same order, and GET /health
+    reports liveness. Connections are kept alive between requests.
+    """
+    import asyncio
+
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        sys.stderr.write(f"Error: invalid address {address!r}, expected [HOST:]PORT\n")
+        return 2
+
+    try:
+        asyncio.run(serve(host or '127.0.0.1', int(port), jobs or os.cpu_count() or 1, timeout))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    except OSError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 2
+    return 0
+
+
+# Bytes read from stdin at a time in --ndjson mode
+NDJSON_READ_SIZE = 1 << 16
+
+
+def answer_ndjson_line(line):
+    """Answer one NDJSON request line, returning the encoded response line
+
+    The response echoes the request's id and adds either result or
+    error (see evaluate_request) and time_us, the microseconds spent.
+    A response that cannot be encoded is replaced by an error response,
+    so no single request can end the stream.
+    """
+    import json
+
+    start = time.perf_counter()
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        response = {"id": None, "error": f"Invalid JSON: {e}"}
+    else:
+        response = {"id": request.get("id") if isinstance(request, dict) else None}
+        response.update(evaluate_request(request))
+
+    response["time_us"] = round((time.perf_counter() - start) * 1e6, 1)
+    try:
+        return json.dumps(response)
+    except Exception as e:
+        return json.dumps({"id": response["id"], "error": f"Cannot encode result: {e}",
+                           "time_us": response["time_us"]})
+
+
+def run_ndjson(stream=None, output=None):
+    """Answer newline-delimited JSON requests until end of input
+
+    Meant for a long-lived coprocess: each input line is a request as
+    accepted by evaluate_request, plus an optional "id", and gets one
+    response line in the same order. Callers may send any number of
+    requests before reading. Input is read in blocks of whatever has
+    arrived, and the responses to a block are written with one flush,
+    so throughput grows with the pipeline depth while a lone request is
+    still answered at once. Caches persist across requests.
+    """
+    stream = stream or sys.stdin.buffer
+    output = output or sys.stdout
+    pending = b""
+
+    while True:
+        data = stream.read1(NDJSON_READ_SIZE)
+        if data:
+            *lines, pending = (pending + data).split(b"\n")
+        else:
+            lines, pending = [pending], b""
+
+        responses = [answer_ndjson_line(line) for line in lines if line.strip()]
+        if responses:
+            output.write("\n".join(responses) + "\n")
+            output.flush()
+        if not data:
+            return 0
+
+
+# Defaults for --daemon; calc-client.py uses the same socket path
+DAEMON_SOCKET = os.environ.get('CALC_SOCKET') or os.path.expanduser("~/.calc_history/calc.sock")
+DAEMON_IDLE_TIMEOUT = 600.0
+
+
+async def handle_daemon_connection(reader, writer, state):
+    """Answer each line sent on one daemon connection
+
+    Every input line gets one response line, 'ok<TAB>OUTPUT' or
+    'error<TAB>MESSAGE'. Clients may send many lines before reading.
+    """
+    state['connections'] += 1
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                writer.write(b"error\tLine too long\n")
+                break
+            if not line:
+                break
+
+            _, output, error = evaluate_batch_line(0, line.decode('utf-8', 'replace'))
+            response = f"ok\t{output}\n" if error is None else f"error\t{error}\n"
+            writer.write(response.encode())
+            state['last_active'] = time.monotonic()
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        state['connections'] -= 1
+        state['last_active'] = time.monotonic()
+        writer.close()
+
+
+async def serve_daemon(listener, idle_timeout):
+    """Accept on a bound Unix socket until idle for idle_timeout seconds or terminated"""
+    import asyncio
+    import signal
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+
+    state = {'connections': 0, 'last_active': time.monotonic()}
+    server = await asyncio.start_unix_server(
+        functools.partial(handle_daemon_connection, state=state), sock=listener)
+
+    async with server:
+        while True:
+            idle = time.monotonic() - state['last_active']
+            if not state['connections'] and idle >= idle_timeout:
+                break
+            await asyncio.sleep(idle_timeout - idle if idle < idle_timeout else idle_timeout)
+
+
+def lock_daemon_socket(path):
+    """Open path + '.lock' and hold an exclusive lock on it until it is closed
+
+    The lock is held while a daemon checks for a running one and binds
+    path, and while it removes path, so two daemons started at once
+    cannot both take it.
+    """
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        fcntl = None
+
+    lock = open(path + '.lock', 'a')
+    if fcntl:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def bind_daemon_socket(path):
+    """Bind and listen on path unless a daemon answers there, returning the socket or None
+
+    A stale socket file left by a crashed daemon is replaced.
+    """
+    import socket
+
+    with lock_daemon_socket(path):
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+                return None
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(path)
+            finally:
+                probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        mask = os.umask(0o177)  # The socket is only for this user
+        try:
+            listener.bind(path)
+            listener.listen()
+        except OSError:
+            listener.close()
+            raise
+        finally:
+            os.umask(mask)
+        return listener
+
+
+def remove_daemon_socket(path, identity):
+    """Remove the socket file at path unless another daemon has bound it since"""
+    with lock_daemon_socket(path):
+        try:
+            if os.path.samestat(os.stat(path), identity):
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def run_daemon(path=DAEMON_SOCKET, idle_timeout=DAEMON_IDLE_TIMEOUT):
+    """Evaluate lines sent to a Unix socket, keeping every cache warm
+
+    This is the server for calc-client.py, which starts it on first use.
+    The daemon evaluates in-process, one line at a time. It exits after
+    idle_timeout seconds without clients. If another daemon already
+    answers on path, it returns at once; a stale socket file left by a
+    crashed daemon is replaced. On exit the socket file is removed,
+    unless another daemon has replaced it in the meantime.
+    """
+    import asyncio
+    import socket
+
+    if not hasattr(socket, 'AF_UNIX'):
+        sys.stderr.write("Error: --daemon needs Unix domain sockets\n")
+        return 2
+
+    identity = None
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        listener = bind_daemon_socket(path)
+        if listener is None:
+            sys.stderr.write(f"A calculator daemon is already listening on {path}\n")
+            return 0
+        identity = os.stat(path)
+        asyncio.run(serve_daemon(listener, idle_timeout))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    except OSError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 2
+    finally:
+        if identity is not None:
+            remove_daemon_socket(path, identity)
+    return 0
+
+
 def display_help():
     """Display help information"""
     print("\CLI Calculator by Chiaki")
@@ -222,7 +2749,12 @@ def display_help():
     print("  history    - Show calculation history")
     print("  clear      - Clear the screen")
     print("  ans        - Use the previous result")
+    print("  x = EXPR   - Store a result in a variable (e.g., rate = 1.07)")
+    print("  vars       - Show stored variables")
     print("  convert    - Convert units (e.g., convert 32 f to c)")
+    print("  cache      - Result and template caches: cache stats, cache on/off, cache clear, cache size N")
+    print("  stats      - Per-phase counters and timings: stats, stats on/off, stats clear")
+    print("  dump       - Show bytecode before/after optimization (e.g., dump 2^10 * x)")
     
     print("\nBasic Operations:")
     print("  + Addition        Example: 5 + 3")
@@ -247,11 +2779,13 @@ def display_help():
     print("  e  - The value of e (2.71828...)\n")
 
 
-def main():
+def run_repl():
     """Main calculator loop"""
     print("CLI Calculator by Chiaki (Type 'help' for commands, 'exit' to quit)")
     
     last_result = 0
+    variables = {}
+    STATS.enabled = True
     
     while True:
         try:
@@ -278,17 +2812,31 @@ def main():
                 os.system('cls' if os.name == 'nt' else 'clear')
                 print("CLI Calculator by Chiaki (Type 'help' for commands, 'exit' to quit)")
             
+            elif user_input.lower() == 'vars':
+                if variables:
+                    for name, value in sorted(variables.items()):
+                        print(f"{name} = {value}")
+                else:
+                    print("No variables defined.")
+            
+            elif user_input.lower().split()[:1] == ['stats']:
+                handle_stats_command(user_input.lower().split()[1:])
+            
+            elif user_input.lower().split()[:1] == ['cache']:
+                handle_cache_command(user_input.lower().split()[1:])
+            
+            elif user_input.lower().startswith('dump '):
+                print(dump_expression(user_input[5:]))
+            
             elif user_input.lower().startswith('convert '):
-                parts = user_input.lower().split()
-                if len(parts) == 5 and parts[3] == 'to':
+                command = parse_convert_command(user_input)
+                if command:
                     try:
-                        value = float(parts[1])
-                        from_unit = parts[2]
-                        to_unit = parts[4]
-                        result = convert_units(value, from_unit, to_unit)
+                        value, from_unit, to_unit = command
+                        result = STATS.measure('convert', convert_units, value, from_unit, to_unit)
                         print(f"{value} {from_unit} = {result} {to_unit}")
                         last_result = result
-                        save_history(f"convert {value} {from_unit} to {to_unit}", result)
+                        STATS.measure('history', save_history, f"convert {value} {from_unit} to {to_unit}", result)
                     except ValueError as e:
                         print(f"Error: {e}")
                 else:
@@ -296,17 +2844,16 @@ def main():
                     print("Example: convert 32 f to c")
             
             elif user_input:
-                expression = user_input.replace('ans', str(last_result))
-                result = evaluate(expression)
+                assignment = parse_assignment(user_input)
+                expression = assignment[1] if assignment else user_input
+                result = evaluate(expression, ans=last_result, **variables)
+                last_result = STATS.measure('format', format_result, result)
+                print(last_result)
                 
-                if result == int(result):
-                    print(int(result))
-                    last_result = int(result)
-                else:
-                    print(result)
-                    last_result = result
+                if assignment:
+                    variables[assignment[0]] = last_result
                 
-                save_history(user_input, last_result)
+                STATS.measure('history', save_history, user_input, last_result)
         
         except ValueError as e:
             print(f"Error: {e}")
@@ -314,5 +2861,176 @@ def main():
             print(f"Unexpected error: {e}")
 
 
+def parse_arguments(argv=None):
+    """Parse command-line options"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CLI Calculator by Chiaki")
+    parser.add_argument('-c', dest='expression', metavar='EXPR',
+                        help="evaluate EXPR (or a convert command), print the result and exit")
+    parser.add_argument('--batch', nargs='?', const='-', metavar='FILE',
+                        help="evaluate one expression per line from FILE (default: stdin) and exit")
+    parser.add_argument('--serve', nargs='?', const=SERVE_ADDRESS, metavar='[HOST:]PORT',
+                        help=f"serve evaluations over HTTP (default address: {SERVE_ADDRESS})")
+    parser.add_argument('--ndjson', action='store_true',
+                        help="answer newline-delimited JSON requests on stdin until end of input")
+    parser.add_argument('--daemon', nargs='?', const=DAEMON_SOCKET, metavar='SOCKET',
+                        help=f"answer calc-client.py requests on a Unix socket (default: {DAEMON_SOCKET})")
+    parser.add_argument('--idle', type=float, default=DAEMON_IDLE_TIMEOUT, metavar='SECONDS',
+                        help=f"exit --daemon after SECONDS without clients (default: {DAEMON_IDLE_TIMEOUT:g})")
+    parser.add_argument('--timeout', type=float, default=SERVE_TIMEOUT, metavar='SECONDS',
+                        help=f"per-request evaluation time limit for --serve (default: {SERVE_TIMEOUT:g})")
+    parser.add_argument('--jobs', type=int, metavar='N',
+                        help="worker processes for --batch (default: 1) or --serve (default: one per CPU)")
+    parser.add_argument('--unordered', action='store_true',
+                        help="write batch results as they finish, prefixed by line number")
+    parser.add_argument('--stats', action='store_true',
+                        help="write per-phase counters and timings to stderr after --batch")
+    parser.add_argument('--profile', nargs='?', const=PROFILE_PATH, metavar='FILE',
+                        help=f"run under cProfile, writing FILE and FILE.txt on exit (default: {PROFILE_PATH})")
+    parser.add_argument('--profile-memory', nargs='?', const=MEMORY_PROFILE_PATH, metavar='FILE',
+                        help="trace allocations with tracemalloc, writing FILE and FILE.txt on exit "
+                             f"(default: {MEMORY_PROFILE_PATH})")
+    parser.add_argument('--no-dedupe', dest='dedupe', action='store_false',
+                        help="evaluate repeated batch lines again instead of reusing results")
+    args = parser.parse_args(argv)
+
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.timeout <= 0:
+        parser.error("--timeout must be positive")
+    if args.idle <= 0:
+        parser.error("--idle must be positive")
+    modes = (args.expression is not None, args.batch is not None, args.serve is not None,
+             args.daemon is not None, args.ndjson)
+    if sum(modes) > 1:
+        parser.error("-c, --batch, --serve, --daemon and --ndjson cannot be combined")
+
+    return args
+
+
+def run_one_shot(expression):
+    """Evaluate one expression or convert command and print the result"""
+    try:
+        print(evaluate_line(expression.strip()))
+    except Exception as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    return 0
+
+
+PROFILE_PATH = "calc.prof"
+MEMORY_PROFILE_PATH = "calc.tracemalloc"
+PROFILE_REPORT_LINES = 40
+
+
+def write_profile_report(profiler, path):
+    """Dump cProfile data to path and a sorted text report to path.txt"""
+    import pstats
+
+    profiler.dump_stats(path)
+    with open(f"{path}.txt", "w") as f:
+        stats = pstats.Stats(profiler, stream=f)
+        for key in ('cumulative', 'tottime'):
+            f.write(f"Top {PROFILE_REPORT_LINES} functions by {key} time\n")
+            stats.sort_stats(key).print_stats(PROFILE_REPORT_LINES)
+    sys.stderr.write(f"Profile written to {path} (report: {path}.txt)\n")
+
+
+def write_memory_report(snapshot, peak, path):
+    """Dump a tracemalloc snapshot to path and a sorted text report to path.txt"""
+    import tracemalloc
+
+    snapshot.dump(path)
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ))
+    statistics = snapshot.statistics('lineno')
+    with open(f"{path}.txt", "w") as f:
+        f.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n")
+        f.write(f"Live at exit: {sum(stat.size for stat in statistics) / 1024:.1f} KiB "
+                f"in {sum(stat.count for stat in statistics)} blocks\n\n")
+        f.write(f"Top {PROFILE_REPORT_LINES} allocation sites by size\n")
+        for stat in statistics[:PROFILE_REPORT_LINES]:
+            f.write(f"{stat}\n")
+    sys.stderr.write(f"Memory profile written to {path} (report: {path}.txt)\n")
+
+
+def run_profiled(function, profile=None, memory=None):
+    """Call function under cProfile and/or tracemalloc and write their reports
+
+    profile and memory are the paths of the raw dumps, readable with
+    pstats.Stats and tracemalloc.Snapshot.load. Reports are written when
+    function returns or raises, including on Ctrl-C. Only this process is
+    traced, not --jobs worker processes. Allocations keep one frame unless
+    tracing was already started with python -X tracemalloc=N, since deeper
+    tracebacks slow evaluation down many times over.
+    """
+    if memory:
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    profiler = None
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        return function()
+    finally:
+        if profiler:
+            profiler.disable()
+            write_profile_report(profiler, profile)
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            write_memory_report(snapshot, peak, memory)
+
+
+def run_mode(args):
+    """Run the mode selected by args, flushing the disk cache afterwards"""
+    try:
+        if args.expression is not None:
+            return run_one_shot(args.expression)
+        if args.batch is not None:
+            return run_batch(args.batch, args.jobs or 1, not args.unordered, args.dedupe, args.stats)
+        if args.serve is not None:
+            return run_server(args.serve, args.jobs, args.timeout)
+        if args.daemon is not None:
+            return run_daemon(args.daemon, args.idle)
+        if args.ndjson:
+            return run_ndjson()
+
+        run_repl()
+        return 0
+    finally:
+        DISK_CACHE.flush()
+
+
+def main(argv=None):
+    """Run a non-interactive mode if requested, otherwise the interactive calculator"""
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # A bare -c EXPR skips argparse, which is slower to import than evaluating
+    if len(argv) == 2 and argv[0] == '-c':
+        try:
+            return run_one_shot(argv[1])
+        finally:
+            DISK_CACHE.flush()
+
+    args = parse_arguments(argv)
+
+    if args.profile or args.profile_memory:
+        return run_profiled(functools.partial(run_mode, args), args.profile, args.profile_memory)
+    return run_mode(args)
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Regression tests for compiled templates, canonical keys and the disk cache
+
+Every compiled path must give what evaluating the expression directly
+with ValueBuilder gives, down to the sign of zero and the error raised.
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import importlib.util
+import marshal
+import math
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+CALCULATOR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "cli-calculator.py")
+
+
+def load_calculator():
+    """Import the calculator script, which cannot be imported by name"""
+    if "calculator" in sys.modules:
+        return sys.modules["calculator"]
+
+    spec = importlib.util.spec_from_file_location("calculator", CALCULATOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["calculator"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+calc = load_calculator()
+
+
+def outcome(function, *args, **kwargs):
+    """Return ('value', result) or ('error', exception type, message)"""
+    try:
+        result = function(*args, **kwargs)
+    except Exception as e:
+        return ('error', type(e), str(e))
+    if isinstance(result, float) and math.isnan(result):
+        return ('value', 'nan')
+    if isinstance(result, float):
+        return ('value', result, math.copysign(1.0, result))
+    return ('value', result)
+
+
+def direct(text, variables):
+    """Evaluate text without compiling it"""
+    return outcome(calc.parse, calc.tokenize(text.lower()), calc.ValueBuilder(variables))
+
+
+def random_expression(generator, depth):
+    """Return a random expression over x, y and a few literals"""
+    if depth == 0 or generator.random() < 0.3:
+        return generator.choice(['x', 'y', '0', '1', '2', '0.5', '3', '7', 'pi'])
+    if generator.random() < 0.15:
+        return f"{generator.choice(calc.FUNCTIONS)}({random_expression(generator, depth - 1)})"
+    return (f"({random_expression(generator, depth - 1)} {generator.choice('+-*/^%')} "
+            f"{random_expression(generator, depth - 1)})")
+
+
+class CompiledPathTest(unittest.TestCase):
+    """Compiled expressions against direct evaluation, with fresh caches"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_path = os.path.join(directory.name, "compiled.cache")
+
+        saved = calc.DISK_CACHE
+        calc.DISK_CACHE = calc.DiskCache(self.cache_path)
+        self.addCleanup(setattr, calc, 'DISK_CACHE', saved)
+        for cache in (calc.TEMPLATE_CACHE, calc.RESULT_CACHE):
+            cache.clear()
+            self.addCleanup(cache.clear)
+
+    def assertMatchesDirect(self, text, variables, engine):
+        compiled = outcome(lambda: calc.compile_expression(text, engine).evaluate(**variables))
+        self.assertEqual(compiled, direct(text, variables), f"{text} with {variables} on {engine}")
+
+    def test_templates_match_direct_evaluation(self):
+        generator = random.Random(15)
+        expressions = [random_expression(generator, 4) for _ in range(300)]
+        for engine in calc.ENGINES:
+            for text in expressions:
+                for x, y in ((-3.0, 0.5), (-0.0, 2.0), (0.0, -1.0), (7.0, 3.0)):
+                    self.assertMatchesDirect(text, {'x': x, 'y': y}, engine)
+
+    def test_signed_zero_is_kept(self):
+        for engine in calc.ENGINES:
+            for text in ("x + 0", "0 + x", "x - 0", "x - 0*(0-1)", "x * 1", "x / 1"):
+                self.assertMatchesDirect(text, {'x': -0.0}, engine)
+
+    def test_fold_binding_falls_back_to_direct_compilation(self):
+        # The first expression of each group compiles the shared template;
+        # the others bind numbers its folded subtree cannot take
+        groups = [
+            ("x * 2^3", "x * 2^0", "x * 3^4"),
+            ("x + 5/(3-1)", "x + 5/(3-3)", "x + 6/(4-2)"),
+            ("x * sqrt(9-5)", "x * sqrt(5-9)", "x * sqrt(3-3)"),
+            ("x * (5-3)", "x * (3-3)", "x * (6-5)"),
+        ]
+        for engine in calc.ENGINES:
+            for group in groups:
+                calc.TEMPLATE_CACHE.clear()
+                for text in group:
+                    for x in (-2.0, -0.0, 3.0):
+                        self.assertMatchesDirect(text, {'x': x}, engine)
+
+    def test_respellings_share_a_canonical_key(self):
+        spellings = [
+            ("2+3", "3 + 2", "(2+3)"),
+            ("x + 3", "3+x", "(3) + (x)"),
+            ("x*y + sin(x)", "sin(x) + y*x", "SIN(X)+(Y*X)"),
+        ]
+        for group in spellings:
+            keys = {calc.compile_expression(text).key for text in group}
+            self.assertEqual(len(keys), 1, group)
+            self.assertIsNotNone(keys.pop(), group)
+
+        different = ["x + 3", "x + 4", "x - 3", "3 - x", "x + y", "2+3", "2+4"]
+        keys = [calc.compile_expression(text).key for text in different]
+        self.assertEqual(len(set(keys)), len(keys))
+
+    def test_cached_results_follow_the_canonical_key(self):
+        self.assertEqual(calc.evaluate("x - 3", x=10), 7.0)
+        self.assertEqual(calc.evaluate("3 - x", x=10), -7.0)
+        self.assertEqual(calc.evaluate("3 + x", x=10.0), calc.evaluate("x+3", x=10))
+        self.assertEqual(calc.evaluate("x + 3", x=-3.0), 0.0)
+
+    def test_records_round_trip(self):
+        # Each binds its own template (3^5 folds to 243, which is no power of two)
+        texts = ["x * 3^5 + sin(7)/y - x*3", "x + 5/(3-1)", "(x+y)*(x+y) - 1.5"]
+        variables = {'x': -1.5, 'y': 4.0}
+        for engine, cls in calc.ENGINES.items():
+            for text in texts:
+                calc.TEMPLATE_CACHE.clear()
+                compiled = calc.compile_expression(text, engine)
+                canonical, values = compiled.key
+                template = calc.TEMPLATE_CACHE.get(('canonical', canonical, engine, True))
+                record = marshal.loads(marshal.dumps(template.to_record()))
+                restored = cls.from_record(text, record).bind(text, values)
+                self.assertEqual(outcome(restored.evaluate, **variables), direct(text, variables))
+
+    def test_disk_cache_round_trip(self):
+        texts = ["x * 2^5 + y/3", "sin(x)*7 - y", "x + 5/(3-3)", "(x+y)*(x+y) - 1.5", "x*(2-2)"]
+        variables = {'x': -1.5, 'y': 4.0}
+        for engine in calc.ENGINES:
+            for text in texts:
+                self.assertMatchesDirect(text, variables, engine)
+        calc.DISK_CACHE.flush()
+        self.assertGreater(len(calc.DISK_CACHE.read_entries()[0]), 0)
+
+        # A new process: nothing in memory, everything from the file
+        calc.TEMPLATE_CACHE.clear()
+        calc.DISK_CACHE = calc.DiskCache(self.cache_path)
+        for engine in calc.ENGINES:
+            for text in texts:
+                self.assertMatchesDirect(text, variables, engine)
+        self.assertGreater(calc.DISK_CACHE.hits, 0)
+
+    def test_damaged_disk_cache_reads_as_empty(self):
+        calc.compile_expression("x * 2^5 + y/3")
+        calc.DISK_CACHE.flush()
+        with open(self.cache_path, 'r+b') as f:
+            f.truncate(40)
+
+        calc.TEMPLATE_CACHE.clear()
+        calc.DISK_CACHE = calc.DiskCache(self.cache_path)
+        self.assertMatchesDirect("x * 2^5 + y/3", {'x': 2.0, 'y': 3.0}, 'bytecode')
+        calc.DISK_CACHE.flush()
+        self.assertGreater(len(calc.DISK_CACHE.read_entries()[0]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()